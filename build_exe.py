@@ -76,6 +76,8 @@ def build_executable():
         "cryptography.hazmat.primitives",
         "cryptography.hazmat.primitives.kdf",
         "cryptography.hazmat.primitives.kdf.pbkdf2",
+        "cryptography.hazmat.primitives.kdf.hkdf",
+        "cryptography.hazmat.primitives.ciphers.aead",
         "cryptography.hazmat.backends",
         "cryptography.hazmat.backends.openssl",
         # Moduli per l'auto-aggiornamento
@@ -2,11 +2,27 @@
 Script per creare l'installer di DatabasePro.
 L'installer include l'exe dell'applicazione al suo interno.
 Compila automaticamente l'exe se non esiste.
+
+Opzioni:
+  --clean                Svuota la cache di PyInstaller (build riproducibile, più lenta)
+  --onedir               Crea una cartella invece di un singolo exe (più veloce in sviluppo)
+  --runtime-tmpdir DIR   Cartella di estrazione a runtime per la modalità --onefile
 """
+import argparse
 import os
 import subprocess
 import sys
 import shutil
+from pathlib import Path
+from typing import Optional
+
+
+DIST = Path("dist")
+EXE = DIST / "DatabasePro.exe"
+INSTALLER = DIST / "DatabasePro_Setup.exe"
+INSTALLER_ONEDIR = DIST / "DatabasePro_Setup" / "DatabasePro_Setup.exe"
+ICON = Path("logo.ico")
+LOGO = Path("logo.png")
 
 
 def build_app_exe():
@@ -20,23 +36,54 @@ def build_app_exe():
     build_executable()
     
     # Verifica che sia stato creato
-    exe_path = os.path.join("dist", "DatabasePro.exe")
-    return os.path.exists(exe_path)
+    return EXE.exists()
+
+
+def compress_app_exe():
+    """Comprime l'exe con UPX prima di includerlo nell'installer.
+    
+    Disattivabile impostando la variabile d'ambiente DBPRO_NO_UPX (utile per il debug).
+    """
+    if os.environ.get("DBPRO_NO_UPX"):
+        print("⚠ Compressione UPX disattivata (DBPRO_NO_UPX)")
+        return
+    
+    upx = shutil.which("upx")
+    if not upx:
+        print("⚠ UPX non trovato, l'exe sarà incluso senza compressione")
+        return
+    
+    size_before = EXE.stat().st_size
+    result = subprocess.run([upx, "--best", "--lzma", str(EXE)], capture_output=True, text=True)
+    if result.returncode != 0:
+        # Es. exe già compresso da una build precedente: non è un errore bloccante
+        print(f"⚠ UPX non applicato: {(result.stderr or result.stdout).strip()}")
+        return
+    
+    size_after = EXE.stat().st_size
+    saved_mb = (size_before - size_after) / (1024 * 1024)
+    print(f"✓ DatabasePro.exe compresso con UPX (-{saved_mb:.1f} MB, "
+          f"{size_after / (1024 * 1024):.1f} MB)")
 
 
 def ensure_exe_exists():
     """Verifica che l'exe esista, altrimenti lo compila"""
-    exe_path = os.path.join("dist", "DatabasePro.exe")
-    if not os.path.exists(exe_path):
+    if not EXE.exists():
         print("⚠ DatabasePro.exe non trovato, lo compilo ora...")
         if not build_app_exe():
             print("✗ Errore durante la compilazione dell'exe")
             return False
+    compress_app_exe()
     return True
 
 
-def build_installer():
-    """Crea l'installer che include l'exe embedded"""
+def build_installer(clean: bool = False, onefile: bool = True, runtime_tmpdir: Optional[str] = None):
+    """Crea l'installer che include l'exe embedded.
+    
+    Di default la build è incrementale (riusa la cache di PyInstaller); `clean=True`
+    forza una build pulita. `onefile` resta il default perché l'aggiornamento
+    automatico scarica un singolo DatabasePro_Setup.exe.
+    """
     
     print("=" * 60)
     print("DatabasePro - Build Installer")
@@ -63,20 +110,26 @@ def build_installer():
         "pyinstaller",
         "--name", "DatabasePro_Setup",
         "--windowed",
-        "--onefile",
-        "--clean",
+        "--onefile" if onefile else "--onedir",
+        "--noconfirm",  # Sovrascrive l'output precedente senza chiedere
         "--uac-admin",  # Richiede privilegi di amministratore
-        "--add-data", "dist\\DatabasePro.exe;.",  # Include l'exe nell'installer
+        "--add-data", f"{EXE};.",  # Include l'exe nell'installer
     ]
     
+    if clean:
+        cmd.append("--clean")
+    
+    if runtime_tmpdir and onefile:
+        cmd.extend(["--runtime-tmpdir", runtime_tmpdir])
+    
     # Aggiungi l'icona se esiste
-    if os.path.exists("logo.ico"):
-        cmd.extend(["--icon", "logo.ico"])
-        cmd.extend(["--add-data", "logo.ico;."])
+    if ICON.exists():
+        cmd.extend(["--icon", str(ICON)])
+        cmd.extend(["--add-data", f"{ICON};."])
         print("✓ Icona trovata")
     
-    if os.path.exists("logo.png"):
-        cmd.extend(["--add-data", "logo.png;."])
+    if LOGO.exists():
+        cmd.extend(["--add-data", f"{LOGO};."])
     
     cmd.append("installer_gui.py")
     
@@ -86,18 +139,30 @@ def build_installer():
     print(f"Comando: {' '.join(cmd)}\n")
     
     try:
-        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
-        print(result.stdout)
+        # Mostra l'output di PyInstaller riga per riga invece di bufferizzarlo tutto
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                text=True, bufsize=1)
+        for line in proc.stdout:
+            sys.stdout.write(line)
+        returncode = proc.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd)
         
-        installer_path = os.path.join("dist", "DatabasePro_Setup.exe")
-        if os.path.exists(installer_path):
-            # Ottieni la dimensione del file
-            size_mb = os.path.getsize(installer_path) / (1024 * 1024)
+        installer_path = INSTALLER if onefile else INSTALLER_ONEDIR
+        
+        # Un solo stat: verifica l'esistenza e ottiene la dimensione
+        try:
+            installer_size = installer_path.stat().st_size
+        except FileNotFoundError:
+            installer_size = None
+        
+        if installer_size is not None:
+            size_mb = installer_size / (1024 * 1024)
             
             print("\n" + "=" * 60)
             print("✓ INSTALLER CREATO CON SUCCESSO!")
             print("=" * 60)
-            print(f"\nFile: dist\\DatabasePro_Setup.exe ({size_mb:.1f} MB)")
+            print(f"\nFile: {installer_path} ({size_mb:.1f} MB)")
             print("\nQuesto installer:")
             print("  - Include l'applicazione DatabasePro.exe")
             print("  - Richiede privilegi di amministratore")
@@ -109,11 +174,27 @@ def build_installer():
         print("\n" + "=" * 60)
         print("✗ ERRORE DURANTE LA BUILD")
         print("=" * 60)
-        print(e.stderr if e.stderr else str(e))
+        print(str(e))
         sys.exit(1)
     
     return False
 
 
+def parse_args(argv=None):
+    """Legge le opzioni da riga di comando"""
+    parser = argparse.ArgumentParser(description="Crea l'installer di DatabasePro")
+    parser.add_argument("--clean", action="store_true",
+                        help="svuota la cache di PyInstaller prima della build")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--onefile", dest="onefile", action="store_true", default=True,
+                      help="crea un singolo exe (default)")
+    mode.add_argument("--onedir", dest="onefile", action="store_false",
+                      help="crea una cartella invece di un singolo exe")
+    parser.add_argument("--runtime-tmpdir", default=None,
+                        help="cartella di estrazione a runtime (solo --onefile)")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    build_installer()
+    args = parse_args()
+    build_installer(clean=args.clean, onefile=args.onefile, runtime_tmpdir=args.runtime_tmpdir)
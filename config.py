@@ -36,6 +36,142 @@ THEMES = {
 }
 
 
+_QSS_TEMPLATE = """
+    QMainWindow, QDialog, QWidget {{
+        background-color: {bg};
+        color: {fg};
+    }}
+    QLabel {{
+        color: {fg};
+    }}
+    
+    QPushButton {{
+        background-color: {primary};
+        color: white;
+        border: none;
+        border-radius: 6px;
+        padding: 8px 16px;
+        font-weight: bold;
+        font-size: 10pt;
+    }}
+    
+    QPushButton:hover {{
+        background-color: {hover};
+    }}
+    
+    QPushButton:pressed {{
+        background-color: {primary_dark};
+    }}
+    
+    QPushButton:disabled {{
+        background-color: {border};
+        color: {fg};
+    }}
+    
+    QLineEdit, QSpinBox, QDoubleSpinBox, QDateEdit, QComboBox {{
+        background-color: {input_bg};
+        color: {fg};
+        border: 1px solid {border};
+        border-radius: 4px;
+        padding: 6px;
+        font-size: 10pt;
+    }}
+    
+    QLineEdit:focus, QSpinBox:focus, QDoubleSpinBox:focus, QDateEdit:focus, QComboBox:focus {{
+        border: 2px solid {primary};
+        background-color: {input_bg};
+    }}
+    
+    QCalendarWidget {{
+        background-color: {card_bg};
+        color: {fg};
+    }}
+    
+    QCalendarWidget QWidget {{
+        color: {fg};
+    }}
+    
+    QCalendarWidget QAbstractItemView {{
+        background-color: {input_bg};
+        selection-background-color: {primary};
+    }}
+    
+    QTableWidget {{
+        background-color: {card_bg};
+        color: {fg};
+        gridline-color: {border};
+        border: 1px solid {border};
+    }}
+    
+    QTableWidget::item {{
+        padding: 4px;
+        color: {fg};
+    }}
+    
+    QTableWidget::item:selected {{
+        background-color: {primary};
+        color: white;
+    }}
+    
+    QHeaderView::section {{
+        background-color: {header_bg};
+        color: {fg};
+        padding: 6px;
+        border: none;
+        border-right: 1px solid {border};
+        font-weight: bold;
+    }}
+    
+    QListWidget {{
+        background-color: {card_bg};
+        color: {fg};
+        border: 1px solid {border};
+        border-radius: 4px;
+    }}
+    
+    QListWidget::item:selected {{
+        background-color: {primary};
+    }}
+    
+    QFrame {{
+        background-color: {bg};
+        border: none;
+    }}
+    
+    QScrollBar:vertical {{
+        background-color: {card_bg};
+        width: 12px;
+        border-radius: 6px;
+    }}
+    
+    QScrollBar::handle:vertical {{
+        background-color: {primary};
+        border-radius: 6px;
+    }}
+    
+    QScrollBar::handle:vertical:hover {{
+        background-color: {hover};
+    }}
+    
+    QComboBox::drop-down {{
+        border: none;
+    }}
+    
+    QComboBox::down-arrow {{
+        image: none;
+    }}
+    
+    QStatusBar {{
+        background-color: {header_bg};
+        color: {fg};
+        border-top: 1px solid {border};
+    }}
+    """
+
+# Stylesheet già compilati per ogni tema, calcolati una sola volta all'import
+_COMPILED_STYLESHEETS = {name: _QSS_TEMPLATE.format_map(palette) for name, palette in THEMES.items()}
+
+
 class StyleManager:
     def __init__(self):
         self.current_theme = "Elegant Dark"
@@ -47,137 +183,9 @@ class StyleManager:
             self.colors = THEMES[theme_name].copy()
     
     def get_stylesheet(self) -> str:
-        return f"""
-        QMainWindow, QDialog, QWidget {{
-            background-color: {self.colors['bg']};
-            color: {self.colors['fg']};
-        }}
-        QLabel {{
-            color: {self.colors['fg']};
-        }}
-        
-        QPushButton {{
-            background-color: {self.colors['primary']};
-            color: white;
-            border: none;
-            border-radius: 6px;
-            padding: 8px 16px;
-            font-weight: bold;
-            font-size: 10pt;
-        }}
-        
-        QPushButton:hover {{
-            background-color: {self.colors['hover']};
-        }}
-        
-        QPushButton:pressed {{
-            background-color: {self.colors['primary_dark']};
-        }}
-        
-        QPushButton:disabled {{
-            background-color: {self.colors['border']};
-            color: {self.colors['fg']};
-        }}
-        
-        QLineEdit, QSpinBox, QDoubleSpinBox, QDateEdit, QComboBox {{
-            background-color: {self.colors['input_bg']};
-            color: {self.colors['fg']};
-            border: 1px solid {self.colors['border']};
-            border-radius: 4px;
-            padding: 6px;
-            font-size: 10pt;
-        }}
-        
-        QLineEdit:focus, QSpinBox:focus, QDoubleSpinBox:focus, QDateEdit:focus, QComboBox:focus {{
-            border: 2px solid {self.colors['primary']};
-            background-color: {self.colors['input_bg']};
-        }}
-        
-        QCalendarWidget {{
-            background-color: {self.colors['card_bg']};
-            color: {self.colors['fg']};
-        }}
-        
-        QCalendarWidget QWidget {{
-            color: {self.colors['fg']};
-        }}
-        
-        QCalendarWidget QAbstractItemView {{
-            background-color: {self.colors['input_bg']};
-            selection-background-color: {self.colors['primary']};
-        }}
-        
-        QTableWidget {{
-            background-color: {self.colors['card_bg']};
-            color: {self.colors['fg']};
-            gridline-color: {self.colors['border']};
-            border: 1px solid {self.colors['border']};
-        }}
-        
-        QTableWidget::item {{
-            padding: 4px;
-            color: {self.colors['fg']};
-        }}
-        
-        QTableWidget::item:selected {{
-            background-color: {self.colors['primary']};
-            color: white;
-        }}
-        
-        QHeaderView::section {{
-            background-color: {self.colors['header_bg']};
-            color: {self.colors['fg']};
-            padding: 6px;
-            border: none;
-            border-right: 1px solid {self.colors['border']};
-            font-weight: bold;
-        }}
-        
-        QListWidget {{
-            background-color: {self.colors['card_bg']};
-            color: {self.colors['fg']};
-            border: 1px solid {self.colors['border']};
-            border-radius: 4px;
-        }}
-        
-        QListWidget::item:selected {{
-            background-color: {self.colors['primary']};
-        }}
-        
-        QFrame {{
-            background-color: {self.colors['bg']};
-            border: none;
-        }}
-        
-        QScrollBar:vertical {{
-            background-color: {self.colors['card_bg']};
-            width: 12px;
-            border-radius: 6px;
-        }}
-        
-        QScrollBar::handle:vertical {{
-            background-color: {self.colors['primary']};
-            border-radius: 6px;
-        }}
-        
-        QScrollBar::handle:vertical:hover {{
-            background-color: {self.colors['hover']};
-        }}
-        
-        QComboBox::drop-down {{
-            border: none;
-        }}
-        
-        QComboBox::down-arrow {{
-            image: none;
-        }}
-        
-        QStatusBar {{
-            background-color: {self.colors['header_bg']};
-            color: {self.colors['fg']};
-            border-top: 1px solid {self.colors['border']};
-        }}
-        """
+        if self.colors == THEMES.get(self.current_theme):
+            return _COMPILED_STYLESHEETS[self.current_theme]
+        return _QSS_TEMPLATE.format_map(self.colors)
 
 
 class ConfigManager:
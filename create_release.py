@@ -7,6 +7,7 @@ Questo script:
 3. Chiede un messaggio di changelog opzionale
 4. Aggiorna il file CHANGELOG.md
 5. Aggiorna la versione in updater.py
+6. Comprime l'installer in formato gzip per ridurre la dimensione dell'asset
 
 Dopo l'esecuzione, pubblicare manualmente la commit su GitHub
 e creare la release con l'installer allegato.
@@ -14,14 +15,23 @@ e creare la release con l'installer allegato.
 import os
 import re
 import sys
-import subprocess
+import gzip
+import mmap
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from build_installer import build_installer
+
 
 UPDATER_FILE = "updater.py"
 INSTALLER_GUI_FILE = "installer_gui.py"
 CHANGELOG_FILE = "CHANGELOG.md"
+INSTALLER_FILE = os.path.join("dist", "DatabasePro_Setup.exe")
+COMPRESSED_INSTALLER_FILE = INSTALLER_FILE + ".gz"
 VERSION_PATTERN = re.compile(r'^\d+\.\d+\.\d+$')
+CURRENT_VERSION_PATTERN = re.compile(rb'CURRENT_VERSION\s*=\s*["\']([^"\']+)["\']')
+APP_VERSION_PATTERN = re.compile(rb'APP_VERSION\s*=\s*["\']([^"\']+)["\']')
 
 
 def validate_version(version: str) -> bool:
@@ -29,52 +39,77 @@ def validate_version(version: str) -> bool:
     return bool(VERSION_PATTERN.match(version.strip()))
 
 
+def _atomic_write(path: str, content):
+    """Scrive `content` (str o bytes) su un file temporaneo e poi lo sostituisce al file di destinazione.
+
+    Evita file troncati se la scrittura fallisce a metà.
+    """
+    tmp_path = f"{path}.tmp"
+    try:
+        if isinstance(content, bytes):
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+        else:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _regex_replace_file(path: str, pattern: re.Pattern, replacement: bytes) -> bool:
+    """Applica `pattern.sub(replacement)` al contenuto binario di `path`.
+
+    Lavora su bytes (nessuna decodifica in str) e riscrive il file solo se il contenuto cambia.
+    Restituisce True se il file è stato modificato.
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+    
+    new_content = pattern.sub(replacement, content)
+    if new_content == content:
+        return False
+    
+    _atomic_write(path, new_content)
+    return True
+
+
 def get_current_version() -> str:
     """Legge la versione corrente dal file updater.py"""
     try:
-        with open(UPDATER_FILE, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        match = re.search(r'CURRENT_VERSION\s*=\s*["\']([^"\']+)["\']', content)
-        if match:
-            return match.group(1)
-    except FileNotFoundError:
+        with open(UPDATER_FILE, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # La ricerca avviene direttamente sulle pagine mappate, senza copiare il file
+            match = CURRENT_VERSION_PATTERN.search(mm)
+            if match:
+                return match.group(1).decode('utf-8')
+    except (FileNotFoundError, ValueError):
+        # ValueError: file vuoto, non mappabile
         pass
     return "0.0.0"
 
 
-def update_version_in_updater(new_version: str):
-    """Aggiorna la versione nel file updater.py"""
-    with open(UPDATER_FILE, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    new_content = re.sub(
-        r'CURRENT_VERSION\s*=\s*["\'][^"\']+["\']',
-        f'CURRENT_VERSION = "{new_version}"',
-        content
+def update_version_in_updater(new_version: str) -> bool:
+    """Aggiorna la versione nel file updater.py. Restituisce False se era già aggiornata."""
+    return _regex_replace_file(
+        UPDATER_FILE,
+        CURRENT_VERSION_PATTERN,
+        f'CURRENT_VERSION = "{new_version}"'.encode('utf-8')
     )
-    
-    with open(UPDATER_FILE, 'w', encoding='utf-8') as f:
-        f.write(new_content)
 
 
-def update_version_in_installer_gui(new_version: str):
-    """Aggiorna la versione nel file installer_gui.py"""
-    with open(INSTALLER_GUI_FILE, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    new_content = re.sub(
-        r'APP_VERSION\s*=\s*["\'][^"\']+["\']',
-        f'APP_VERSION = "{new_version}"',
-        content
+def update_version_in_installer_gui(new_version: str) -> bool:
+    """Aggiorna la versione nel file installer_gui.py. Restituisce False se era già aggiornata."""
+    return _regex_replace_file(
+        INSTALLER_GUI_FILE,
+        APP_VERSION_PATTERN,
+        f'APP_VERSION = "{new_version}"'.encode('utf-8')
     )
-    
-    with open(INSTALLER_GUI_FILE, 'w', encoding='utf-8') as f:
-        f.write(new_content)
 
 
-def update_changelog(version: str, message: str):
-    """Aggiunge una nuova entry al changelog"""
+def update_changelog(version: str, message: str) -> bool:
+    """Aggiunge una nuova entry al changelog. Restituisce False se la versione è già presente in cima."""
     today = datetime.now().strftime("%Y-%m-%d")
     
     # Leggi il changelog esistente
@@ -84,6 +119,11 @@ def update_changelog(version: str, message: str):
     except FileNotFoundError:
         content = "# Changelog\n\nTutte le modifiche importanti a DatabasePro saranno documentate in questo file.\n\n---\n"
     
+    # Se la entry più recente riguarda già questa versione non riscriviamo il file
+    top_entry = next((line for line in content.split('\n') if line.startswith('## [')), None)
+    if top_entry is not None and top_entry.startswith(f'## [{version}]'):
+        return False
+    
     # Prepara la nuova entry
     if message.strip():
         new_entry = f"""
@@ -123,8 +163,8 @@ def update_changelog(version: str, message: str):
     lines.insert(insert_index, new_entry)
     new_content = '\n'.join(lines)
     
-    with open(CHANGELOG_FILE, 'w', encoding='utf-8') as f:
-        f.write(new_content)
+    _atomic_write(CHANGELOG_FILE, new_content)
+    return True
 
 
 def run_build_installer():
@@ -133,22 +173,44 @@ def run_build_installer():
     print("Compilazione installer...")
     print("=" * 60 + "\n")
     
-    result = subprocess.run([sys.executable, "build_installer.py"])
+    # Build pulita e --onefile: l'asset della release deve essere riproducibile
+    # e l'aggiornamento automatico scarica un singolo exe
+    try:
+        built = build_installer(clean=True, onefile=True)
+    except SystemExit:
+        built = False
     
-    if result.returncode != 0:
+    if not built:
         print("\n✗ Errore durante la compilazione dell'installer")
         return False
     
     # Verifica che l'installer sia stato creato
-    installer_path = os.path.join("dist", "DatabasePro_Setup.exe")
-    if not os.path.exists(installer_path):
-        print(f"\n✗ Installer non trovato: {installer_path}")
+    if not os.path.exists(INSTALLER_FILE):
+        print(f"\n✗ Installer non trovato: {INSTALLER_FILE}")
         return False
     
     print("\n✓ Installer compilato con successo")
     return True
 
 
+def compress_installer() -> bool:
+    """Comprime l'installer in .exe.gz a blocchi, senza caricarlo tutto in memoria"""
+    print("\nCompressione installer...")
+    try:
+        with open(INSTALLER_FILE, 'rb') as src, \
+                gzip.open(COMPRESSED_INSTALLER_FILE, 'wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+    except OSError as e:
+        print(f"✗ Errore durante la compressione dell'installer: {e}")
+        return False
+    
+    original_mb = os.path.getsize(INSTALLER_FILE) / (1024 * 1024)
+    compressed_mb = os.path.getsize(COMPRESSED_INSTALLER_FILE) / (1024 * 1024)
+    print(f"✓ Installer compresso: {COMPRESSED_INSTALLER_FILE} "
+          f"({original_mb:.1f} MB -> {compressed_mb:.1f} MB)")
+    return True
+
+
 def main():
     print("=" * 60)
     print("DatabasePro - Preparazione Release")
@@ -175,20 +237,37 @@ def main():
     print("\n" + "-" * 60)
     print("Aggiornamento file di versione...")
     
-    update_version_in_updater(new_version)
-    print(f"✓ Versione aggiornata in {UPDATER_FILE}")
+    # I tre file sono indipendenti: li aggiorniamo in parallelo
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [
+            executor.submit(update_version_in_updater, new_version),
+            executor.submit(update_version_in_installer_gui, new_version),
+            executor.submit(update_changelog, new_version, changelog_message),
+        ]
+        updater_changed, installer_changed, changelog_changed = [f.result() for f in futures]
     
-    update_version_in_installer_gui(new_version)
-    print(f"✓ Versione aggiornata in {INSTALLER_GUI_FILE}")
-    
-    update_changelog(new_version, changelog_message)
-    print(f"✓ Changelog aggiornato in {CHANGELOG_FILE}")
+    if updater_changed:
+        print(f"✓ Versione aggiornata in {UPDATER_FILE}")
+    else:
+        print(f"• {UPDATER_FILE} già alla versione {new_version}, nessuna modifica")
+    if installer_changed:
+        print(f"✓ Versione aggiornata in {INSTALLER_GUI_FILE}")
+    else:
+        print(f"• {INSTALLER_GUI_FILE} già alla versione {new_version}, nessuna modifica")
+    if changelog_changed:
+        print(f"✓ Changelog aggiornato in {CHANGELOG_FILE}")
+    else:
+        print(f"• {CHANGELOG_FILE} contiene già la versione {new_version}, nessuna modifica")
     
     # Step 4: Compila l'installer (dopo aver aggiornato le versioni!)
     if not run_build_installer():
         sys.exit(1)
     
-    # Step 5: Istruzioni finali
+    # Step 5: Comprimi l'installer per la release
+    if not compress_installer():
+        sys.exit(1)
+    
+    # Step 6: Istruzioni finali
     print("\n" + "=" * 60)
     print("✓ PREPARAZIONE COMPLETATA!")
     print("=" * 60)
@@ -208,10 +287,12 @@ Prossimi passi:
    - Vai su: https://github.com/Ft2801/Database-Python/releases/new
    - Tag: v{new_version}
    - Titolo: DatabasePro {new_version}
-   - Allega: dist\\DatabasePro_Setup.exe
+   - Allega: dist\\DatabasePro_Setup.exe (richiesto dall'aggiornamento automatico)
+   - Allega: dist\\DatabasePro_Setup.exe.gz (download manuale più leggero)
    - Pubblica la release
 
 L'installer si trova in: dist\\DatabasePro_Setup.exe
+L'installer compresso si trova in: dist\\DatabasePro_Setup.exe.gz
 """)
 
 
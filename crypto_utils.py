@@ -0,0 +1,83 @@
+import base64
+import os
+import struct
+
+try:
+    from cryptography.fernet import InvalidToken
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+except Exception:
+    InvalidToken = Exception
+    InvalidTag = Exception
+
+
+# Formato a blocchi AES-256-GCM usato dal database (.enc) e dagli allegati; ogni file
+# inizia con un proprio MAGIC, scritto e controllato dal chiamante. Dopo il MAGIC:
+# ripetizione di [lunghezza (uint32 LE), flag ultimo blocco][nonce || ciphertext || tag].
+# Indice del blocco e flag ultimo blocco sono autenticati come dati associati, così
+# blocchi riordinati o un file troncato vengono rilevati.
+GCM_FRAME_HEADER = struct.Struct('<IB')
+GCM_ASSOCIATED_DATA = struct.Struct('<QB')
+GCM_NONCE_SIZE = 12
+
+
+def derive_aead_key(key: bytes, info: bytes) -> bytes:
+    """Deriva una chiave AES-256-GCM dalla chiave Fernet, senza riusarne direttamente i byte."""
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=info)
+    return hkdf.derive(base64.urlsafe_b64decode(key))
+
+
+def encrypt_gcm_frames(aead, src, dst, chunk_size: int, bufs=None) -> None:
+    """Cifra il file `src` in `dst` (dopo il MAGIC) un blocco alla volta.
+
+    I blocchi vengono letti con readinto in due buffer da `chunk_size`; `bufs` permette
+    di riusare la stessa coppia di bytearray tra una chiamata e l'altra.
+    """
+    if bufs is None:
+        bufs = (bytearray(chunk_size), bytearray(chunk_size))
+    buf, next_buf = bufs
+    index = 0
+    size = src.readinto(buf)
+    while True:
+        # Leggi in anticipo il blocco successivo per sapere se questo è l'ultimo
+        next_size = src.readinto(next_buf)
+        is_last = not next_size
+        nonce = os.urandom(GCM_NONCE_SIZE)
+        sealed = aead.encrypt(nonce, memoryview(buf)[:size], GCM_ASSOCIATED_DATA.pack(index, is_last))
+        dst.write(GCM_FRAME_HEADER.pack(GCM_NONCE_SIZE + len(sealed), is_last))
+        dst.write(nonce)
+        dst.write(sealed)
+        if is_last:
+            return
+        buf, next_buf = next_buf, buf
+        size = next_size
+        index += 1
+
+
+def decrypt_gcm_frames(aead, src, dst) -> None:
+    """Decifra in `dst` i blocchi letti da `src` (posizionato dopo il MAGIC).
+
+    Solleva InvalidToken se il file è troncato, se un blocco non si autentica
+    o se ci sono dati dopo l'ultimo blocco.
+    """
+    index = 0
+    while True:
+        header = src.read(GCM_FRAME_HEADER.size)
+        if len(header) != GCM_FRAME_HEADER.size:
+            raise InvalidToken('Encrypted data is truncated')
+        frame_len, is_last = GCM_FRAME_HEADER.unpack(header)
+        frame = src.read(frame_len)
+        if len(frame) != frame_len:
+            raise InvalidToken('Encrypted data is truncated')
+        try:
+            plain = aead.decrypt(frame[:GCM_NONCE_SIZE], frame[GCM_NONCE_SIZE:],
+                                 GCM_ASSOCIATED_DATA.pack(index, is_last))
+        except InvalidTag:
+            raise InvalidToken('Encrypted chunk failed authentication')
+        dst.write(plain)
+        if is_last:
+            if src.read(1):
+                raise InvalidToken('Unexpected data after the last chunk')
+            return
+        index += 1
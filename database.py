@@ -3,14 +3,42 @@ import csv
 import shutil
 import tempfile
 import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache, wraps
 from typing import Optional, Dict, List, Tuple
 from collections import deque
 
 try:
-    from cryptography.fernet import Fernet, InvalidToken
+    from cryptography.fernet import Fernet
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 except Exception:
     Fernet = None
-    InvalidToken = Exception
+    AESGCM = None
+
+from crypto_utils import derive_aead_key, encrypt_gcm_frames, decrypt_gcm_frames
+
+
+# PRAGMA applicati ad ogni connessione: WAL rende i commit append sequenziali,
+# synchronous=NORMAL dimezza gli fsync (sicuro in WAL contro crash dell'app)
+_CONNECTION_PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous={synchronous};
+PRAGMA temp_store=MEMORY;
+PRAGMA mmap_size=268435456;
+PRAGMA cache_size=-20000;
+PRAGMA busy_timeout=5000;
+"""
+
+# UPDATE/DELETE ... RETURNING (SQLite 3.35+) evitano le SELECT aggiuntive per l'undo
+_SQLITE_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Formato del file .enc: _GCM_MAGIC seguito dai blocchi AES-256-GCM di crypto_utils
+_ENC_CHUNK_SIZE = 1024 * 1024
+_GCM_MAGIC = b'DBPGCM01'
+# Buffer di scrittura dei file crittografati/decrittati: poche write grandi invece di molte piccole
+_IO_BUFFER_SIZE = 1 << 20
 
 
 def _clear_file_attributes(file_path: str) -> bool:
@@ -59,20 +87,117 @@ def _set_hidden_system_attributes(file_path: str) -> bool:
     return False
 
 
+@lru_cache(maxsize=512)
+def _build_insert_sql(table_name: str, cols: Tuple[str, ...]) -> str:
+    quoted_cols = ", ".join(f'"{c}"' for c in cols)
+    placeholders = ", ".join("?" * len(cols))
+    return f'INSERT INTO "{table_name}" ({quoted_cols}) VALUES ({placeholders})'
+
+
+@lru_cache(maxsize=512)
+def _build_update_sql(table_name: str, cols: Tuple[str, ...], returning: bool = False) -> str:
+    set_clause = ", ".join(f'"{c}"=?' for c in cols)
+    sql = f'UPDATE "{table_name}" SET {set_clause} WHERE id=?'
+    return sql + " RETURNING *" if returning else sql
+
+
+@lru_cache(maxsize=512)
+def _build_delete_sql(table_name: str, returning: bool = False) -> str:
+    sql = f'DELETE FROM "{table_name}" WHERE id=?'
+    return sql + " RETURNING *" if returning else sql
+
+
+def _fast_copy(src: str, dst: str) -> None:
+    """Copia `src` in `dst` lasciando la copia al kernel quando possibile.
+    
+    Su Linux copy_file_range evita il passaggio dei dati in user space e, su btrfs/XFS,
+    crea un reflink. Niente hardlink: i file del database vengono riscritti sul posto
+    e un link modificherebbe anche il backup.
+    """
+    if hasattr(os, 'copy_file_range'):
+        try:
+            fd_in = os.open(src, os.O_RDONLY)
+            try:
+                fd_out = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                try:
+                    remaining = os.fstat(fd_in).st_size
+                    while remaining > 0:
+                        copied = os.copy_file_range(fd_in, fd_out, remaining)
+                        if copied == 0:
+                            break
+                        remaining -= copied
+                finally:
+                    os.close(fd_out)
+            finally:
+                os.close(fd_in)
+            if remaining == 0:
+                shutil.copymode(src, dst)
+                return
+        except OSError:
+            # Es. file system diversi su kernel vecchi: si ripiega sulla copia normale
+            pass
+    shutil.copy(src, dst)
+
+
+def _with_conn_lock(method):
+    """Esegue il metodo tenendo _conn_lock, così il timer di sync non fotografa una scrittura a metà."""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._conn_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _remove_file(file_path: str) -> None:
+    """Remove a temporary file, retrying with backoff while Windows releases its locks."""
+    # Su POSIX un file aperto si può comunque eliminare: nessun motivo di riprovare
+    attempts = 3 if os.name == 'nt' else 1
+    for attempt in range(attempts):
+        try:
+            os.remove(file_path)
+            return
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            if attempt == attempts - 1:
+                print(f"Error removing temp file: {e}")
+                return
+            time.sleep(0.02 * (2 ** attempt))
+
+
 class DatabaseManager:
-    def __init__(self, db_path: str, key: bytes = None, key_path: Optional[str] = None):
+    def __init__(self, db_path: str, key: bytes = None, key_path: Optional[str] = None,
+                 durable: bool = False, sync_interval: int = 1):
         """
         db_path: path to base db file (will be stored as <db_path>.enc when encrypted)
         key: raw Fernet key (optional). If not provided and key_path given, key is loaded from file.
         key_path: if provided and key missing, will attempt to read key from this path. If not exists, a key is generated and saved.
+        durable: if True, keep synchronous=FULL (fsync on every commit) instead of NORMAL.
+        sync_interval: number of write operations between two syncs (1 = sync after every write).
         
-        Runs the DB against a temporary decrypted copy when encryption is enabled.
+        With encryption enabled the decrypted DB lives only in memory; snapshots are written
+        to a temporary file just long enough to be encrypted.
         """
         self.db_path = db_path
         self.encrypted_path = f"{db_path}.enc"
         self._temp_db_file = None
         self._uses_encryption = False
         self._fernet = None
+        self._aead = None
+        
+        # La crittografia gira su un thread separato; _sync_lock serializza gli encrypt
+        self._sync_lock = threading.Lock()
+        self._sync_state_lock = threading.Lock()
+        self._sync_thread = None
+        # _conn_lock copre le scritture (fino al commit) e lo snapshot preso dal timer di sync:
+        # il timer non vede mai una transazione a metà né una connessione in chiusura
+        self._conn_lock = threading.RLock()
+        self._closed = False
+        self._pending_snapshot = None
+        # Stato del DB (vedi _data_version) all'ultimo snapshot crittografato; None = da crittografare
+        self._encrypted_version = None
+        # Coppia di buffer di lettura riusata da _encrypt_file (protetta da _sync_lock)
+        self._enc_bufs = None
 
         # Load or generate key if requested
         if key is None and key_path:
@@ -81,39 +206,59 @@ class DatabaseManager:
         if key and Fernet is not None:
             self._uses_encryption = True
             self._fernet = Fernet(key)
-            # Ensure encrypted storage exists; if only plain DB exists, migrate it
+            self._aead = AESGCM(derive_aead_key(key, b'DatabasePro database AES-GCM'))
+            # Il DB decrittato vive in memoria; check_same_thread=False permette al timer
+            # di leggerne uno snapshot (solo lettura, vedi _on_deferred_sync)
+            self.conn = sqlite3.connect(':memory:', check_same_thread=False, cached_statements=256)
             if os.path.exists(self.encrypted_path):
-                # decrypt to temp and use
-                self._temp_db_file = self._decrypt_to_temp(self.encrypted_path)
-            else:
-                if os.path.exists(self.db_path):
-                    # encrypt existing plain DB to encrypted_path, then decrypt to temp
-                    self._encrypt_file(self.db_path, self.encrypted_path)
-                    # remove plain file to avoid leaving unencrypted copy
-                    try:
-                        os.remove(self.db_path)
-                    except Exception:
-                        pass
-                    self._temp_db_file = self._decrypt_to_temp(self.encrypted_path)
-                else:
-                    # no db exists yet; create an empty temp DB
-                    self._temp_db_file = tempfile.NamedTemporaryFile(delete=False, suffix='.db').name
+                # decrypt to temp, load it in memory and drop the plain copy right away
+                tmp_path = self._decrypt_to_temp(self.encrypted_path)
+                try:
+                    self._load_into_memory(tmp_path)
+                finally:
+                    os.remove(tmp_path)
+                self._encrypted_version = self._data_version()
+            elif os.path.exists(self.db_path):
+                # migrate the existing plain DB: load it, encrypt it, then remove the plain file
+                self._load_into_memory(self.db_path)
+                self._encrypt_snapshot(self._take_snapshot())
+                try:
+                    os.remove(self.db_path)
+                except Exception:
+                    pass
         else:
             # no encryption: work directly on db_path
             self._temp_db_file = self.db_path
+            self.conn = sqlite3.connect(self._temp_db_file, cached_statements=256)
 
-        # Connect to the working DB (either temp decrypted file or plain path)
-        self.conn = sqlite3.connect(self._temp_db_file)
         self.cursor = self.conn.cursor()
+        self.cursor.executescript(
+            _CONNECTION_PRAGMAS.format(synchronous="FULL" if durable else "NORMAL")
+        )
         self._init_metadata()
 
         # Sistema di undo/redo (max 3 operazioni)
         self.undo_stack = deque(maxlen=3)
         self.redo_stack = deque(maxlen=3)
         
+        # Cache di PRAGMA table_info per tabella, invalidata dalle operazioni DDL
+        self._columns_cache: Dict[str, List[Tuple]] = {}
+        
         # Contatore per sync periodico
         self._operation_count = 0
-        self._sync_interval = 1  # Sync ad ogni operazione per massima sicurezza
+        self._sync_interval = sync_interval  # Default 1: sync ad ogni operazione per massima sicurezza
+        self._batch_depth = 0
+        
+        # Soglie per la crittografia: al massimo ogni N secondi, salvo troppe righe modificate
+        self._sync_delay = 5.0
+        self._sync_dirty_changes = 1000
+        self._synced_changes = self.conn.total_changes
+        self._last_sync_ts = time.monotonic()
+        self._sync_timer = None
+        
+        # Checkpoint TRUNCATE del WAL (solo database non crittografati)
+        self._housekeeping_interval = 60.0
+        self._last_housekeeping = time.monotonic()
     
     def _init_metadata(self):
         sql = """
@@ -128,40 +273,236 @@ class DatabaseManager:
         self.cursor.execute(sql)
         self.conn.commit()
 
+    @_with_conn_lock
     def sync(self):
-        """Sincronizza il database: commit e crittografa il file temporaneo.
+        """Sincronizza il database: commit e crittografa uno snapshot del database.
         
         Chiamare periodicamente per evitare perdita dati in caso di crash.
+        Con la crittografia attiva l'encrypt avviene in background:
+        usare wait_for_sync() se serve attendere che il file .enc sia aggiornato.
         """
+        if self._batch_depth:
+            # Dentro batch() il sync avviene una sola volta all'uscita dal blocco
+            return
         try:
+            self._cancel_deferred_sync()
+            self._last_sync_ts = time.monotonic()
+            
             if getattr(self, 'conn', None):
                 self.conn.commit()
-                # Force WAL checkpoint - use TRUNCATE for more aggressive write
+                if self._uses_encryption:
+                    self._synced_changes = self.conn.total_changes
+                    snapshot_path = self._take_snapshot_if_changed()
+                    if snapshot_path:
+                        self._request_background_sync(snapshot_path)
+                else:
+                    # PASSIVE non attende i lettori; il TRUNCATE è rimandato a _housekeeping/close
+                    try:
+                        self.cursor.execute("PRAGMA wal_checkpoint(PASSIVE)")
+                    except Exception:
+                        pass
+                    self._housekeeping()
+        except Exception as e:
+            print(f"Error during sync: {e}")
+    
+    def _commit(self):
+        """Commit delle operazioni; dentro batch() il commit è rimandato alla fine del blocco."""
+        if not self._batch_depth:
+            self.conn.commit()
+    
+    @contextmanager
+    def batch(self):
+        """Raggruppa più operazioni in un'unica transazione con un solo sync alla fine.
+        
+        Uso: `with db.batch(): ...`. Se il blocco solleva un'eccezione la transazione
+        viene annullata (insieme alle voci di undo/redo aggiunte nel blocco).
+        I blocchi annidati confluiscono in quello più esterno.
+        """
+        with self._conn_lock:
+            if self._batch_depth:
+                self._batch_depth += 1
                 try:
-                    self.cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
-                except Exception:
-                    pass
+                    yield self
+                finally:
+                    self._batch_depth -= 1
+                return
             
-            if self._uses_encryption and self._temp_db_file and os.path.exists(self._temp_db_file):
+            old_interval = self._sync_interval
+            undo_state, redo_state = list(self.undo_stack), list(self.redo_stack)
+            self._sync_interval = float('inf')
+            self._batch_depth = 1
+            if not self.conn.in_transaction:
+                self.conn.execute("BEGIN")
+            try:
+                yield self
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                # Le DDL annullate (es. add_column) potrebbero essere già nella cache
+                self._columns_cache.clear()
+                self.undo_stack.clear()
+                self.undo_stack.extend(undo_state)
+                self.redo_stack.clear()
+                self.redo_stack.extend(redo_state)
+                raise
+            finally:
+                self._batch_depth = 0
+                self._sync_interval = old_interval
+                self._operation_count = 0
+                self.sync()
+    
+    def _housekeeping(self):
+        """Tronca il file WAL, al massimo una volta ogni `_housekeeping_interval` secondi."""
+        now = time.monotonic()
+        if now - self._last_housekeeping < self._housekeeping_interval:
+            return
+        self._last_housekeeping = now
+        try:
+            self.cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except Exception:
+            pass
+    
+    def wait_for_sync(self):
+        """Attende la fine della crittografia in background, se in corso."""
+        with self._sync_state_lock:
+            thread = self._sync_thread
+        if thread is not None:
+            thread.join()
+    
+    def _maybe_sync(self):
+        """Sync automatico dopo un certo numero di operazioni.
+        
+        Con la crittografia attiva, l'intero database viene ri-crittografato al massimo ogni
+        `_sync_delay` secondi (o prima, oltre `_sync_dirty_changes` righe modificate);
+        le modifiche nel frattempo vengono sincronizzate da un timer.
+        """
+        self._operation_count += 1
+        if self._operation_count < self._sync_interval:
+            return
+        self._operation_count = 0
+        
+        if not self._uses_encryption:
+            self.sync()
+            return
+        
+        elapsed = time.monotonic() - self._last_sync_ts
+        unsynced = self.conn.total_changes - self._synced_changes
+        if elapsed >= self._sync_delay or unsynced >= self._sync_dirty_changes:
+            self.sync()
+        else:
+            self._schedule_deferred_sync(self._sync_delay - elapsed)
+    
+    def _schedule_deferred_sync(self, delay: float):
+        if self._sync_timer is not None:
+            return
+        self._sync_timer = threading.Timer(delay, self._on_deferred_sync)
+        self._sync_timer.daemon = True
+        self._sync_timer.start()
+    
+    def _cancel_deferred_sync(self):
+        timer, self._sync_timer = self._sync_timer, None
+        if timer is not None:
+            timer.cancel()
+    
+    def _on_deferred_sync(self):
+        # Eseguito sul thread del timer: le operazioni fanno già il commit, qui si legge
+        # soltanto uno snapshot. Controllo e snapshot avvengono sotto _conn_lock.
+        with self._conn_lock:
+            if self._sync_timer is threading.current_thread():
+                self._sync_timer = None
+            conn = getattr(self, 'conn', None)
+            if self._closed or conn is None:
+                return
+            if conn.in_transaction:
+                self._schedule_deferred_sync(self._sync_delay)
+                return
+            try:
+                self._last_sync_ts = time.monotonic()
+                self._synced_changes = conn.total_changes
+                snapshot_path = self._take_snapshot_if_changed()
+                if snapshot_path:
+                    self._request_background_sync(snapshot_path)
+            except Exception as e:
+                print(f"Error during deferred sync: {e}")
+    
+    def _load_into_memory(self, source_path: str):
+        """Copia il database `source_path` nella connessione in memoria."""
+        src = sqlite3.connect(source_path)
+        try:
+            src.backup(self.conn)
+        finally:
+            src.close()
+    
+    def _take_snapshot(self) -> str:
+        """Scrive uno snapshot consistente del database in memoria su un file temporaneo."""
+        tmp = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
+        snapshot_path = tmp.name
+        tmp.close()
+        dst = sqlite3.connect(snapshot_path)
+        try:
+            self.conn.backup(dst)
+        finally:
+            dst.close()
+        return snapshot_path
+    
+    def _data_version(self) -> Tuple[int, int]:
+        """Identifica lo stato del database: righe modificate e versione dello schema.
+        
+        total_changes non conta le operazioni DDL, coperte da schema_version.
+        """
+        schema_version = self.conn.execute("PRAGMA schema_version").fetchone()[0]
+        return self.conn.total_changes, schema_version
+    
+    def _take_snapshot_if_changed(self) -> Optional[str]:
+        """Come _take_snapshot, ma restituisce None se il DB non è cambiato dall'ultimo snapshot."""
+        version = self._data_version()
+        if version == self._encrypted_version and os.path.exists(self.encrypted_path):
+            return None
+        snapshot_path = self._take_snapshot()
+        self._encrypted_version = version
+        return snapshot_path
+    
+    def _request_background_sync(self, snapshot_path: str):
+        """Accoda uno snapshot da crittografare; uno snapshot non ancora elaborato viene sostituito."""
+        with self._sync_state_lock:
+            stale, self._pending_snapshot = self._pending_snapshot, snapshot_path
+            if self._sync_thread is None:
+                self._sync_thread = threading.Thread(target=self._background_sync, daemon=True)
+                self._sync_thread.start()
+        if stale:
+            _remove_file(stale)
+    
+    def _background_sync(self):
+        while True:
+            with self._sync_state_lock:
+                snapshot_path, self._pending_snapshot = self._pending_snapshot, None
+                if snapshot_path is None:
+                    self._sync_thread = None
+                    return
+            try:
+                self._encrypt_snapshot(snapshot_path)
+            except Exception as e:
+                # Il prossimo sync dovrà ricrittografare anche se il DB non cambia
+                self._encrypted_version = None
+                print(f"Error during background sync: {e}")
+    
+    def _encrypt_snapshot(self, snapshot_path: str):
+        """Crittografa lo snapshot nel file .enc e lo elimina."""
+        try:
+            with self._sync_lock:
                 # Rimuovi attributi nascosti/sistema per poter sovrascrivere
                 if os.path.exists(self.encrypted_path):
                     _clear_file_attributes(self.encrypted_path)
                 
-                # Verifica che il file temp esista e non sia vuoto
-                temp_size = os.path.getsize(self._temp_db_file)
-                if temp_size > 0:
-                    self._encrypt_file(self._temp_db_file, self.encrypted_path)
+                # Verifica che lo snapshot non sia vuoto
+                if os.path.getsize(snapshot_path) > 0:
+                    self._encrypt_file(snapshot_path, self.encrypted_path)
                     # Nascondi il file crittografato
                     _set_hidden_system_attributes(self.encrypted_path)
-        except Exception as e:
-            print(f"Error during sync: {e}")
-    
-    def _maybe_sync(self):
-        """Sync automatico dopo un certo numero di operazioni."""
-        self._operation_count += 1
-        if self._operation_count >= self._sync_interval:
-            self._operation_count = 0
-            self.sync()
+                else:
+                    print("Warning: database snapshot is empty, skipping encryption")
+        finally:
+            _remove_file(snapshot_path)
 
     # --- Encryption helpers ---
     def _load_or_create_key_file(self, key_path: str) -> bytes:
@@ -198,30 +539,65 @@ class DatabaseManager:
 
     def _decrypt_to_temp(self, source_path: str) -> str:
         """Decrypt `source_path` (encrypted) to a temp file and return its path."""
-        if self._fernet is None:
+        if self._aead is None:
             raise RuntimeError('Encryption not configured')
-        with open(source_path, 'rb') as ef:
-            encrypted = ef.read()
-        try:
-            decrypted = self._fernet.decrypt(encrypted)
-        except InvalidToken:
-            raise
         tmp = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
         tmp_path = tmp.name
         tmp.close()
-        with open(tmp_path, 'wb') as tf:
-            tf.write(decrypted)
+        try:
+            # Nessun fsync: il file temporaneo viene caricato in memoria ed eliminato subito
+            with open(source_path, 'rb') as ef, open(tmp_path, 'wb', buffering=_IO_BUFFER_SIZE) as tf:
+                magic = ef.read(len(_GCM_MAGIC))
+                if magic == _GCM_MAGIC:
+                    decrypt_gcm_frames(self._aead, ef, tf)
+                else:
+                    # Vecchio formato: un unico token Fernet per tutto il file
+                    ef.seek(0)
+                    tf.write(self._fernet.decrypt(ef.read()))
+        except Exception:
+            # Non lasciare su disco dati parzialmente decrittati
+            os.remove(tmp_path)
+            raise
         return tmp_path
 
     def _encrypt_file(self, source_path: str, dest_path: str):
-        """Encrypt source_path into dest_path using the current Fernet key."""
-        if self._fernet is None:
+        """Encrypt source_path into dest_path with AES-GCM.
+        
+        The file is processed in chunks of _ENC_CHUNK_SIZE, so peak memory does not
+        depend on the database size.
+        """
+        if self._aead is None:
             raise RuntimeError('Encryption not configured')
-        with open(source_path, 'rb') as sf:
-            data = sf.read()
-        token = self._fernet.encrypt(data)
-        with open(dest_path, 'wb') as df:
-            df.write(token)
+        # I blocchi vengono letti con readinto in due buffer riusati tra una sync e l'altra,
+        # invece di allocare un nuovo bytes da 1 MB per ogni blocco
+        if self._enc_bufs is None:
+            self._enc_bufs = (bytearray(_ENC_CHUNK_SIZE), bytearray(_ENC_CHUNK_SIZE))
+        # Scrittura su un file temporaneo accanto a dest_path, poi os.replace: un crash
+        # durante la crittografia non tronca mai l'unica copia del database
+        dest_dir = os.path.dirname(os.path.abspath(dest_path))
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(dest_path) + '.', suffix='.tmp', dir=dest_dir)
+        try:
+            with open(source_path, 'rb') as sf, os.fdopen(fd, 'wb', buffering=_IO_BUFFER_SIZE) as df:
+                df.write(_GCM_MAGIC)
+                encrypt_gcm_frames(self._aead, sf, df, _ENC_CHUNK_SIZE, self._enc_bufs)
+                # Un solo fsync alla fine, dopo aver svuotato il buffer
+                df.flush()
+                os.fsync(df.fileno())
+            os.replace(tmp_path, dest_path)
+        except BaseException:
+            _remove_file(tmp_path)
+            raise
+        
+        # Rende persistente anche la rinomina (solo POSIX; su Windows le directory non si aprono)
+        if os.name != 'nt':
+            try:
+                dir_fd = os.open(dest_dir, os.O_RDONLY)
+                try:
+                    os.fsync(dir_fd)
+                finally:
+                    os.close(dir_fd)
+            except OSError:
+                pass
         
         # Hide the encrypted database file for security on Windows
         try:
@@ -245,6 +621,7 @@ class DatabaseManager:
         )
         return [row[0] for row in self.cursor.fetchall()]
     
+    @_with_conn_lock
     def create_table(self, table_name: str, columns: List[Dict]) -> bool:
         try:
             cols_sql = ["id INTEGER PRIMARY KEY AUTOINCREMENT"]
@@ -253,6 +630,7 @@ class DatabaseManager:
             
             cols_joined = ", ".join(cols_sql)
             sql = f'CREATE TABLE "{table_name}" ({cols_joined})'
+            self._columns_cache.pop(table_name, None)
             self.cursor.execute(sql)
             
             for col in columns:
@@ -262,26 +640,35 @@ class DatabaseManager:
                         col['special'], col.get('extra', '')
                     )
             
-            self.conn.commit()
+            self._commit()
             self.sync()
             return True
         except Exception as e:
             print(f"Error creating table: {e}")
             return False
     
+    @_with_conn_lock
     def drop_table(self, table_name: str) -> bool:
         try:
+            self._columns_cache.pop(table_name, None)
             self.cursor.execute(f'DROP TABLE "{table_name}"')
             self.cursor.execute("DELETE FROM _sys_columns WHERE table_name=?", (table_name,))
-            self.conn.commit()
+            self._commit()
             self.sync()
             return True
         except Exception:
             return False
     
     def get_columns(self, table_name: str) -> List[Tuple]:
-        self.cursor.execute(f'PRAGMA table_info("{table_name}")')
-        return self.cursor.fetchall()
+        columns = self._columns_cache.get(table_name)
+        if columns is None:
+            self.cursor.execute(f'PRAGMA table_info("{table_name}")')
+            columns = self.cursor.fetchall()
+            # Le tabelle inesistenti non vengono memorizzate
+            if columns:
+                self._columns_cache[table_name] = columns
+        # Copia: i chiamanti possono modificare la lista senza sporcare la cache
+        return list(columns)
     
     def get_records(self, table_name: str, where_clause: str = "", params: Tuple = ()) -> List[Tuple]:
         if where_clause:
@@ -291,15 +678,21 @@ class DatabaseManager:
             self.cursor.execute(f'SELECT * FROM "{table_name}"')
         return self.cursor.fetchall()
     
+    def get_values(self, table_name: str, columns: List[str], record_id) -> Optional[Tuple]:
+        """Valori delle sole `columns` del record `record_id` (None se il record non esiste)."""
+        cols = ", ".join(f'"{col}"' for col in columns)
+        self.cursor.execute(f'SELECT {cols} FROM "{table_name}" WHERE id=?', (record_id,))
+        return self.cursor.fetchone()
+    
+    @_with_conn_lock
     def insert_record(self, table_name: str, data: Dict) -> bool:
         try:
-            cols = list(data.keys())
-            quoted_cols = [f'"{c}"' for c in cols]
-            placeholders = ", ".join(["?" for _ in cols])
-            sql = f'INSERT INTO "{table_name}" ({", ".join(quoted_cols)}) VALUES ({placeholders})'
-            self.cursor.execute(sql, list(data.values()))
+            # Parametri posizionali: i nomi delle colonne sono scelti dall'utente e possono
+            # contenere spazi o accenti, non validi come parametri :nome
+            sql = _build_insert_sql(table_name, tuple(data))
+            self.cursor.execute(sql, tuple(data.values()))
             new_id = self.cursor.lastrowid
-            self.conn.commit()
+            self._commit()
             
             # Salva per undo
             self.undo_stack.append({
@@ -317,21 +710,24 @@ class DatabaseManager:
             print(f"Error inserting record: {e}")
             return False
     
+    @_with_conn_lock
     def update_record(self, table_name: str, record_id: int, data: Dict) -> bool:
         try:
             # Salva lo stato precedente per undo
             old_record = self.get_records(table_name, "id=?", (record_id,))
             
-            cols = list(data.keys())
-            set_clause = ", ".join([f'"{col}"=?' for col in cols])
-            values = list(data.values()) + [record_id]
-            sql = f'UPDATE "{table_name}" SET {set_clause} WHERE id=?'
-            self.cursor.execute(sql, values)
-            
-            # Ottieni il nuovo record dopo l'update
-            new_record = self.get_records(table_name, "id=?", (record_id,))
+            cols = tuple(data)
+            values = (*data.values(), record_id)
+            if _SQLITE_HAS_RETURNING:
+                # Il nuovo record arriva direttamente dall'UPDATE
+                self.cursor.execute(_build_update_sql(table_name, cols, True), values)
+                new_record = self.cursor.fetchall()
+            else:
+                self.cursor.execute(_build_update_sql(table_name, cols), values)
+                # Ottieni il nuovo record dopo l'update
+                new_record = self.get_records(table_name, "id=?", (record_id,))
             
-            self.conn.commit()
+            self._commit()
             
             # Salva per undo con sia old che new data
             if old_record and new_record:
@@ -352,17 +748,23 @@ class DatabaseManager:
             print(f"Error updating record: {e}")
             return False
     
+    @_with_conn_lock
     def delete_record(self, table_name: str, record_id: int) -> bool:
         try:
-            # Salva il record per undo
-            old_record = self.get_records(table_name, "id=?", (record_id,))
-            
-            self.cursor.execute(f'DELETE FROM "{table_name}" WHERE id=?', (record_id,))
-            self.conn.commit()
+            if _SQLITE_HAS_RETURNING:
+                # Il record eliminato (e i nomi delle colonne) arrivano direttamente dal DELETE
+                self.cursor.execute(_build_delete_sql(table_name, True), (record_id,))
+                old_record = self.cursor.fetchall()
+                columns = [desc[0] for desc in self.cursor.description]
+            else:
+                # Salva il record per undo
+                old_record = self.get_records(table_name, "id=?", (record_id,))
+                columns = [col[1] for col in self.get_columns(table_name)]
+                self.cursor.execute(_build_delete_sql(table_name), (record_id,))
+            self._commit()
             
             # Salva per undo
             if old_record:
-                columns = self.get_columns(table_name)
                 self.undo_stack.append({
                     'action': 'delete',
                     'table': table_name,
@@ -379,22 +781,26 @@ class DatabaseManager:
         except Exception:
             return False
     
+    @_with_conn_lock
     def add_column(self, table_name: str, col_name: str, sql_type: str, 
                   special_type: str = "", extra_info: str = "") -> bool:
         try:
+            self._columns_cache.pop(table_name, None)
             self.cursor.execute(f'ALTER TABLE "{table_name}" ADD COLUMN "{col_name}" {sql_type}')
             if special_type:
                 self.save_special_type(table_name, col_name, special_type, extra_info)
-            self.conn.commit()
+            self._commit()
             self.sync()
             return True
         except Exception:
             return False
     
+    @_with_conn_lock
     def rename_column(self, table_name: str, old_name: str, new_name: str) -> bool:
         """Rinomina una colonna in una tabella"""
         try:
             # SQLite supporta ALTER TABLE RENAME COLUMN da versione 3.25+
+            self._columns_cache.pop(table_name, None)
             self.cursor.execute(f'ALTER TABLE "{table_name}" RENAME COLUMN "{old_name}" TO "{new_name}"')
             
             # Aggiorna anche i metadati se esistono
@@ -403,7 +809,7 @@ class DatabaseManager:
                 (new_name, table_name, old_name)
             )
             
-            self.conn.commit()
+            self._commit()
             self.sync()
             return True
         except Exception as e:
@@ -417,40 +823,69 @@ class DatabaseManager:
         )
         return self.cursor.fetchone()
     
+    def get_special_types_map(self, table_name: str) -> Dict[str, Tuple]:
+        """Restituisce {col_name: (special_type, extra_info)} per la tabella con una sola query."""
+        self.cursor.execute(
+            "SELECT col_name, special_type, extra_info FROM _sys_columns WHERE table_name=?",
+            (table_name,)
+        )
+        return {col_name: (special_type, extra_info) for col_name, special_type, extra_info in self.cursor.fetchall()}
+    
+    @_with_conn_lock
     def save_special_type(self, table_name: str, col_name: str, special_type: str, extra_info: str = ""):
         try:
             self.cursor.execute(
                 "INSERT OR REPLACE INTO _sys_columns VALUES (?, ?, ?, ?)",
                 (table_name, col_name, special_type, extra_info)
             )
-            self.conn.commit()
+            self._commit()
         except Exception:
             pass
     
     def export_csv(self, table_name: str, file_path: str) -> bool:
         try:
-            records = self.get_records(table_name)
-            columns = [col[1] for col in self.get_columns(table_name)]
+            table_info = self.get_columns(table_name)
+            columns = [col[1] for col in table_info]
+            
+            # Solo le colonne FILE e quelle con affinità BLOB (tipo BLOB o nessun tipo)
+            # possono contenere bytes: le altre non vengono controllate cella per cella
+            self.cursor.execute(
+                "SELECT col_name FROM _sys_columns WHERE table_name=? AND special_type='FILE'",
+                (table_name,)
+            )
+            file_cols = {row[0] for row in self.cursor.fetchall()}
+            blob_idx = {
+                i for i, col in enumerate(table_info)
+                if col[1] in file_cols or not col[2] or 'BLOB' in col[2].upper()
+            }
             
-            with open(file_path, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(columns)
-                for row in records:
-                    clean_row = []
-                    for cell in row:
-                        if isinstance(cell, bytes):
-                            clean_row.append("<BINARY_FILE>")
-                        else:
-                            clean_row.append(cell if cell is not None else "")
-                    writer.writerow(clean_row)
+            # Cursore dedicato: le righe vengono scritte man mano, senza fetchall()
+            cursor = self.conn.execute(f'SELECT * FROM "{table_name}"')
+            try:
+                with open(file_path, 'w', newline='', encoding='utf-8') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(columns)
+                    if not blob_idx:
+                        for row in cursor:
+                            writer.writerow(["" if cell is None else cell for cell in row])
+                    else:
+                        for row in cursor:
+                            writer.writerow([
+                                "<BINARY_FILE>" if i in blob_idx and isinstance(cell, bytes)
+                                else ("" if cell is None else cell)
+                                for i, cell in enumerate(row)
+                            ])
+            finally:
+                cursor.close()
             return True
         except Exception as e:
             print(f"Export error: {e}")
             return False
     
+    @_with_conn_lock
     def import_csv(self, table_name: str, file_path: str) -> Tuple[bool, int]:
         try:
-            existing_cols = [col[1] for col in self.get_columns(table_name)]
+            existing_cols = {col[1] for col in self.get_columns(table_name)}
             
             with open(file_path, 'r', encoding='utf-8') as f:
                 reader = csv.reader(f)
@@ -464,13 +899,14 @@ class DatabaseManager:
                 placeholders = ", ".join(["?" for _ in headers])
                 sql = f'INSERT INTO "{table_name}" ({", ".join(quoted_headers)}) VALUES ({placeholders})'
                 
-                count = 0
-                for row in reader:
-                    self.cursor.execute(sql, row)
-                    count += 1
+                # Un'unica transazione per tutto il file: commit (e sync) una sola volta,
+                # rollback automatico se una riga fallisce.
+                # Il reader viene consumato direttamente da executemany (nessun generatore
+                # Python intermedio); rowcount riporta il totale delle righe inserite
+                with self.batch():
+                    self.cursor.executemany(sql, reader)
+                    count = self.cursor.rowcount
                 
-                self.conn.commit()
-                self.sync()
                 return True, count
         except Exception as e:
             print(f"Import error: {e}")
@@ -478,11 +914,17 @@ class DatabaseManager:
     
     def backup_db(self, backup_path: str) -> bool:
         try:
+            # Porta su disco le modifiche in sospeso prima di copiare
+            self.sync()
+            self.wait_for_sync()
+            if not self._uses_encryption:
+                # sync() fa solo un checkpoint PASSIVE: qui serve il file principale completo
+                self.cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
             # If using encryption, back up the encrypted file; otherwise back up plain DB
             if self._uses_encryption and os.path.exists(self.encrypted_path):
-                shutil.copy(self.encrypted_path, backup_path)
+                _fast_copy(self.encrypted_path, backup_path)
             else:
-                shutil.copy(self.db_path, backup_path)
+                _fast_copy(self.db_path, backup_path)
             return True
         except Exception:
             return False
@@ -495,6 +937,7 @@ class DatabaseManager:
         """Verifica se ci sono operazioni da ripristinare"""
         return len(self.redo_stack) > 0
     
+    @_with_conn_lock
     def undo(self) -> Tuple[bool, str]:
         """Annulla l'ultima operazione"""
         if not self.can_undo():
@@ -508,18 +951,13 @@ class DatabaseManager:
             if action == 'insert':
                 # Annulla insert = delete
                 record_id = operation['id']
-                self.cursor.execute(f'DELETE FROM "{table}" WHERE id=?', (record_id,))
+                self.cursor.execute(_build_delete_sql(table), (record_id,))
                 self.redo_stack.append(operation)
                 
             elif action == 'delete':
                 # Annulla delete = re-insert
                 old_data = operation['old_data']
-                columns = operation['columns']
-                col_names = [col[1] for col in columns]
-                
-                quoted_cols = [f'"{c}"' for c in col_names]
-                placeholders = ", ".join(["?" for _ in col_names])
-                sql = f'INSERT INTO "{table}" ({", ".join(quoted_cols)}) VALUES ({placeholders})'
+                sql = _build_insert_sql(table, tuple(operation['columns']))
                 self.cursor.execute(sql, old_data)
                 self.redo_stack.append(operation)
                 
@@ -530,14 +968,12 @@ class DatabaseManager:
                 columns = self.get_columns(table)
                 
                 # Crea update con i vecchi valori
-                col_names = [col[1] for col in columns[1:]]  # Skip ID
-                set_clause = ", ".join([f'"{col}"=?' for col in col_names])
+                col_names = tuple(col[1] for col in columns[1:])  # Skip ID
                 values = list(old_data[1:]) + [record_id]
-                sql = f'UPDATE "{table}" SET {set_clause} WHERE id=?'
-                self.cursor.execute(sql, values)
+                self.cursor.execute(_build_update_sql(table, col_names), values)
                 self.redo_stack.append(operation)
             
-            self.conn.commit()
+            self._commit()
             self.sync()
             return True, f"Operazione annullata: {action}"
             
@@ -545,6 +981,7 @@ class DatabaseManager:
             print(f"Undo error: {e}")
             return False, f"Errore durante l'annullamento: {e}"
     
+    @_with_conn_lock
     def redo(self) -> Tuple[bool, str]:
         """Ripristina l'ultima operazione annullata"""
         if not self.can_redo():
@@ -558,13 +995,13 @@ class DatabaseManager:
             if action == 'insert':
                 # Redo insert = elimina di nuovo il record
                 record_id = operation['id']
-                self.cursor.execute(f'DELETE FROM "{table}" WHERE id=?', (record_id,))
+                self.cursor.execute(_build_delete_sql(table), (record_id,))
                 self.undo_stack.append(operation)
                 
             elif action == 'delete':
                 # Redo delete = elimina di nuovo il record
                 record_id = operation['id']
-                self.cursor.execute(f'DELETE FROM "{table}" WHERE id=?', (record_id,))
+                self.cursor.execute(_build_delete_sql(table), (record_id,))
                 self.undo_stack.append(operation)
                 
             elif action == 'update':
@@ -575,16 +1012,14 @@ class DatabaseManager:
                     columns = self.get_columns(table)
                     
                     # Crea update con i nuovi valori
-                    col_names = [col[1] for col in columns[1:]]  # Skip ID
-                    set_clause = ", ".join([f'"{col}"=?' for col in col_names])
+                    col_names = tuple(col[1] for col in columns[1:])  # Skip ID
                     values = list(new_data[1:]) + [record_id]
-                    sql = f'UPDATE "{table}" SET {set_clause} WHERE id=?'
-                    self.cursor.execute(sql, values)
+                    self.cursor.execute(_build_update_sql(table, col_names), values)
                     self.undo_stack.append(operation)
                 else:
                     return False, "Dati insufficienti per ripristinare update"
             
-            self.conn.commit()
+            self._commit()
             self.sync()
             return True, f"Operazione ripristinata: {action}"
             
@@ -594,11 +1029,27 @@ class DatabaseManager:
     
     def close(self):
         # Prevent double-close
-        if getattr(self, '_closed', False):
+        if getattr(self, '_closed', True):
             return
-        self._closed = True
+        with self._conn_lock:
+            self._closed = True
+            timer, self._sync_timer = self._sync_timer, None
+        
+        # Ferma il timer e attende un callback già partito (che, visto _closed, non fa nulla);
+        # un'eventuale crittografia in corso prosegue in background
+        if timer is not None:
+            timer.cancel()
+            if timer is not threading.current_thread():
+                timer.join()
 
-        # Close connection and, if encryption enabled, encrypt temporary DB back to storage
+        with self._conn_lock:
+            self._close_connection()
+
+        # Il file .enc deve essere completo prima di restituire il controllo
+        self.wait_for_sync()
+    
+    def _close_connection(self):
+        # Close connection and, if encryption enabled, encrypt a final snapshot back to storage
         try:
             if getattr(self, 'conn', None):
                 try:
@@ -607,11 +1058,22 @@ class DatabaseManager:
                 except Exception as e:
                     print(f"Error committing on close: {e}")
                 
-                try:
-                    # Force checkpoint for WAL mode databases to ensure all data is written
-                    self.cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
-                except Exception:
-                    pass
+                if self._uses_encryption:
+                    try:
+                        snapshot_path = self._take_snapshot_if_changed()
+                        if snapshot_path:
+                            # L'encrypt finale parte subito sul thread di sync e si sovrappone
+                            # alla chiusura della connessione; uno snapshot ancora in coda
+                            # viene sostituito da questo
+                            self._request_background_sync(snapshot_path)
+                    except Exception as e:
+                        print(f"Error writing database snapshot on close: {e}")
+                else:
+                    try:
+                        # Force checkpoint for WAL mode databases to ensure all data is written
+                        self.cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                    except Exception:
+                        pass
                 
                 # Chiudi cursore prima della connessione
                 try:
@@ -630,45 +1092,3 @@ class DatabaseManager:
                 
         except Exception as e:
             print(f"Error during database close: {e}")
-
-        # Piccola pausa per permettere a Windows di rilasciare i lock sui file
-        import time
-        time.sleep(0.1)
-
-        if self._uses_encryption:
-            try:
-                if self._temp_db_file and os.path.exists(self._temp_db_file):
-                    # Verifica che il file temporaneo sia valido prima di crittografarlo
-                    if os.path.getsize(self._temp_db_file) > 0:
-                        # Rimuovi attributi nascosti/sistema dal file .enc per poterlo sovrascrivere
-                        if os.path.exists(self.encrypted_path):
-                            _clear_file_attributes(self.encrypted_path)
-                        self._encrypt_file(self._temp_db_file, self.encrypted_path)
-                        # Nascondi il file crittografato
-                        _set_hidden_system_attributes(self.encrypted_path)
-                    else:
-                        print("Warning: temp database file is empty, skipping encryption")
-                elif os.path.exists(self.db_path):
-                    if os.path.exists(self.encrypted_path):
-                        _clear_file_attributes(self.encrypted_path)
-                    self._encrypt_file(self.db_path, self.encrypted_path)
-                    _set_hidden_system_attributes(self.encrypted_path)
-            except Exception as e:
-                print(f"Error encrypting database on close: {e}")
-            finally:
-                # Rimuovi file temporaneo con retry
-                if self._temp_db_file and self._temp_db_file != self.db_path:
-                    for attempt in range(3):
-                        try:
-                            if os.path.exists(self._temp_db_file):
-                                os.remove(self._temp_db_file)
-                            # Rimuovi anche eventuali file WAL/SHM
-                            for suffix in ['-wal', '-shm']:
-                                wal_file = self._temp_db_file + suffix
-                                if os.path.exists(wal_file):
-                                    os.remove(wal_file)
-                            break
-                        except Exception as e:
-                            if attempt == 2:
-                                print(f"Error removing temp file: {e}")
-                            time.sleep(0.1)
@@ -1,47 +1,213 @@
 from typing import Tuple
+from functools import lru_cache, partial
+import hmac
+import html
 import os
+import re
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+import auth as auth_mod
 from file_utils import (
-    get_files_dir, encrypt_file, parse_file_value, format_file_value, 
-    delete_encrypted_file, parse_multi_file_value, format_multi_file_value,
-    get_display_names_from_multi_file
+    get_files_dir, get_file_aead, encrypt_file, delete_encrypted_file,
+    parse_multi_file_value, format_multi_file_value
 )
 from PyQt6.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QLineEdit,
     QComboBox, QListWidget, QListWidgetItem, QFrame, QScrollArea, QWidget, QMessageBox,
-    QFileDialog, QDateEdit, QDoubleSpinBox, QApplication, QPlainTextEdit
+    QFileDialog, QDateEdit, QApplication, QPlainTextEdit
 )
-from PyQt6.QtCore import QDate, Qt, QPropertyAnimation, QEasingCurve, QTimer
-from PyQt6.QtGui import QFont, QPixmap, QIcon
+from PyQt6.QtCore import (
+    QDate, Qt, QPropertyAnimation, QEasingCurve, QTimer, pyqtSlot, pyqtSignal,
+    QObject, QRunnable, QThreadPool, QLocale
+)
+from PyQt6.QtGui import QFont, QPixmap, QIcon, QDoubleValidator
 
 from validators import InputValidator
 from config import StyleManager
 from database import DatabaseManager
 
 
+# Tasti che confermano il dialog / salvano il campo
+_ENTER_KEYS = frozenset({Qt.Key.Key_Return.value, Qt.Key.Key_Enter.value})
+
+# Messaggi diagnostici di autenticazione (disattivati nelle build di rilascio)
+_DEBUG_AUTH = False
+
+
+def _auth_log(message: str) -> None:
+    try:
+        print(message)
+    except Exception:
+        # Nelle build --windowed stdout può non esistere
+        pass
+
+
+# Tipi di colonna offerti da AddColumnDialog: nome mostrato -> (tipo SQL, tipo speciale)
+_COLUMN_TYPES = {
+    "TESTO": ("TEXT", ""),
+    "DATA": ("TEXT", "DATE"),
+    "FILE": ("TEXT", "FILE"),
+}
+
+# Nuova password: solo lettere e numeri, con almeno una lettera e una cifra
+_PASSWORD_RE = re.compile(r'^(?=.*[A-Za-z])(?=.*\d)[A-Za-z0-9]+$')
+
+
+# Contenuto del tutorial: (titolo sezione, righe)
+_TUTORIAL_SECTIONS = (
+    ("Gestione Tabelle", (
+        "• Nella barra laterale sinistra visualizzi tutte le tabelle del database",
+        "• Clicca su una tabella per visualizzarne i dati",
+        "• Usa il pulsante 'Nuova Tabella' per creare una nuova tabella",
+        "• Seleziona una tabella e clicca 'Elimina Tabella' per eliminarla",
+    )),
+    ("Visualizzazione Dati", (
+        "• Una volta selezionata una tabella, i dati vengono visualizzati nella griglia centrale",
+        "• La colonna ID è nascosta ma viene usata internamente",
+        "• Doppio clic su una cella per aprire l'editor dedicato e modificare il valore",
+        "• La ricerca in alto a destra consente di filtrare i dati",
+    )),
+    ("Gestione Record", (
+        "• Nuovo Record: Aggiunge un nuovo record alla tabella",
+        "• Modifica: Modifica il record selezionato",
+        "• Elimina: Elimina il record selezionato",
+        "• Doppio clic su una cella per modificarla direttamente",
+    )),
+    ("Gestione Colonne", (
+        "• Aggiungi Colonna: Aggiunge una nuova colonna alla tabella",
+        "• Doppio clic sull'intestazione: Rinomina una colonna esistente",
+        "• Tipi disponibili: TESTO, DATA, FILE",
+        "• Le colonne FILE permettono di allegare più file a ciascun record",
+    )),
+    ("Scorciatoie da Tastiera", (
+        "• Invio: Salva la modifica nella cella o nel campo",
+        "• Shift+Invio: Vai a capo nelle caselle di testo multi-riga",
+        "• Ctrl+Z: Annulla l'ultima operazione (max 3)",
+        "• Ctrl+Shift+Z: Ripristina l'operazione annullata",
+        "• Doppio clic: Apre l'editor per celle o rinomina colonne",
+    )),
+    ("Undo/Redo", (
+        "• Il sistema tiene traccia delle ultime 3 operazioni",
+        "• Supporta: inserimento, modifica ed eliminazione record",
+        "• Ctrl+Z annulla l'ultima operazione",
+        "• Ctrl+Shift+Z ripristina l'operazione annullata",
+        "• Il feedback appare nella barra di stato",
+    )),
+    ("Sicurezza", (
+        "• Il database è protetto con crittografia AES-256",
+        "• Cambia Password: Modifica la password di accesso all'applicazione",
+        "• Backup: Crea una copia di sicurezza del database",
+    )),
+    ("Aggiornamenti", (
+        "• L'applicazione verifica automaticamente la presenza di aggiornamenti all'avvio",
+        "• Se disponibile una nuova versione, verrà proposto il download e l'installazione",
+        "• Gli aggiornamenti preservano tutti i dati esistenti",
+    )),
+    ("Ricerca", (
+        "• Usa il campo di ricerca in alto a destra per filtrare i record",
+        "• La ricerca è case-insensitive e funziona su tutti i campi",
+    )),
+)
+
+
+@lru_cache(maxsize=None)
+def _tutorial_html() -> str:
+    """HTML del tutorial, generato una sola volta da _TUTORIAL_SECTIONS."""
+    parts = []
+    for section_name, lines in _TUTORIAL_SECTIONS:
+        parts.append(
+            f'<p style="font-size: 11pt; font-weight: bold; margin-top: 8px; margin-bottom: 2px;">'
+            f'{html.escape(section_name)}</p>'
+        )
+        parts.extend(f'<p style="margin: 2px 0;">{html.escape(line)}</p>' for line in lines)
+    return "".join(parts)
+
+
+@lru_cache(maxsize=None)
+def _font(size: int, bold: bool = False) -> QFont:
+    """Font "Segoe UI" condiviso per dimensione/peso.
+    
+    Creato al primo uso (serve una QApplication già avviata); setFont ne fa una copia,
+    quindi la stessa istanza può essere riusata da tutte le etichette.
+    """
+    if bold:
+        return QFont("Segoe UI", size, QFont.Weight.Bold)
+    return QFont("Segoe UI", size)
+
+
+class _EncryptSignals(QObject):
+    finished = pyqtSignal(list)  # [(original_name, encrypted_name), ...]
+
+
+# Numero massimo di allegati cifrati contemporaneamente da EncryptFilesWorker
+_MAX_ENCRYPT_THREADS = 8
+
+
+class EncryptFilesWorker(QRunnable):
+    """Cifra i file selezionati nella cartella degli allegati, fuori dal thread della GUI."""
+    def __init__(self, src_paths):
+        super().__init__()
+        self.src_paths = src_paths
+        self.signals = _EncryptSignals()
+    
+    def run(self):
+        jobs = []
+        try:
+            files_dir = get_files_dir()
+            # La chiave viene creata (se manca) prima di partire, così i thread
+            # non rischiano di generarne due diverse in parallelo
+            get_file_aead()
+            for src_path in self.src_paths:
+                if src_path:
+                    original_name = os.path.basename(src_path)
+                    # Create encrypted filename with .enc extension
+                    encrypted_name = f"{uuid.uuid4().hex}.enc"
+                    jobs.append((original_name, encrypted_name, src_path,
+                                 os.path.join(files_dir, encrypted_name)))
+        except Exception:
+            jobs = []
+        
+        added = []
+        if jobs:
+            # Cifratura e I/O rilasciano il GIL: più file selezionati vengono cifrati in parallelo
+            with ThreadPoolExecutor(max_workers=min(_MAX_ENCRYPT_THREADS, len(jobs))) as executor:
+                results = list(executor.map(lambda job: encrypt_file(job[2], job[3]), jobs))
+            # Ordine di selezione mantenuto
+            added = [(original_name, encrypted_name)
+                     for (original_name, encrypted_name, _, _), ok in zip(jobs, results) if ok]
+        self.signals.finished.emit(added)
+
+
+class DeleteFilesWorker(QRunnable):
+    """Elimina gli allegati cifrati non più referenziati, fuori dal thread della GUI."""
+    def __init__(self, encrypted_names):
+        super().__init__()
+        self.encrypted_names = encrypted_names
+    
+    def run(self):
+        files_dir = get_files_dir()
+        for encrypted_name in self.encrypted_names:
+            delete_encrypted_file(encrypted_name, files_dir)
+
+
 class MultiLineTextEdit(QPlainTextEdit):
     """Custom text edit that saves on Enter and allows newlines with Shift+Enter."""
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, save_callback=None):
         super().__init__(parent)
         self.setMaximumHeight(100)
         self.setMinimumHeight(60)
+        # Chiamata con Invio (senza Shift): fornita dal dialog che contiene il campo
+        self._save_callback = save_callback
     
     def keyPressEvent(self, event):
         # Shift+Enter inserts a newline
-        if event.key() in (Qt.Key.Key_Return, Qt.Key.Key_Enter):
+        if event.key() in _ENTER_KEYS:
             if event.modifiers() & Qt.KeyboardModifier.ShiftModifier:
                 # Insert newline
                 super().keyPressEvent(event)
-            else:
-                # Trigger save (handled by parent dialog)
-                # Find parent RecordDialog and save
-                parent = self.parent()
-                while parent:
-                    if hasattr(parent, 'save_btn_ref') and hasattr(parent, 'save_record'):
-                        if parent.save_btn_ref and parent.save_btn_ref.isEnabled():
-                            parent.save_record()
-                        return
-                    parent = parent.parent()
+            elif self._save_callback is not None:
+                # Trigger save (handled by the owning dialog)
+                self._save_callback()
         else:
             super().keyPressEvent(event)
 
@@ -53,150 +219,91 @@ class TutorialDialog(QDialog):
         
         self.setWindowTitle("Tutorial - Guida all'Applicazione")
         self.center_on_screen()
+        self._populated = False
         self.init_ui()
     
     def center_on_screen(self):
-        screen = QApplication.primaryScreen()
-        screen_geometry = screen.geometry()
-        width = int(screen_geometry.width() * 0.6)
-        height = int(screen_geometry.height() * 0.75)
-        
-        self.setGeometry(0, 0, width, height)
-        
-        x = (screen_geometry.width() - width) // 2
-        y = (screen_geometry.height() - height) // 2
-        self.move(x, y)
+        center_dialog(self, 0.6, 0.75)
     
     def init_ui(self):
+        # Solo la cornice: le sezioni vengono create alla prima apertura (vedi showEvent)
         main_layout = QVBoxLayout()
         main_layout.setSpacing(15)
         main_layout.setContentsMargins(20, 20, 20, 20)
         
         title = QLabel("Guida all'Applicazione")
-        title_font = QFont("Segoe UI", 14, QFont.Weight.Bold)
+        title_font = _font(14, True)
         title.setFont(title_font)
         main_layout.addWidget(title)
         
-        scroll = QScrollArea()
-        scroll.setWidgetResizable(True)
-        scroll_widget = QWidget()
-        scroll_layout = QVBoxLayout()
-        
-        tutorial_sections = [
-            {
-                "title": "Gestione Tabelle",
-                "content": [
-                    "• Nella barra laterale sinistra visualizzi tutte le tabelle del database",
-                    "• Clicca su una tabella per visualizzarne i dati",
-                    "• Usa il pulsante 'Nuova Tabella' per creare una nuova tabella",
-                    "• Seleziona una tabella e clicca 'Elimina Tabella' per eliminarla"
-                ]
-            },
-            {
-                "title": "Visualizzazione Dati",
-                "content": [
-                    "• Una volta selezionata una tabella, i dati vengono visualizzati nella griglia centrale",
-                    "• La colonna ID è nascosta ma viene usata internamente",
-                    "• Doppio clic su una cella per aprire l'editor dedicato e modificare il valore",
-                    "• La ricerca in alto a destra consente di filtrare i dati"
-                ]
-            },
-            {
-                "title": "Gestione Record",
-                "content": [
-                    "• Nuovo Record: Aggiunge un nuovo record alla tabella",
-                    "• Modifica: Modifica il record selezionato",
-                    "• Elimina: Elimina il record selezionato",
-                    "• Doppio clic su una cella per modificarla direttamente"
-                ]
-            },
-            {
-                "title": "Gestione Colonne",
-                "content": [
-                    "• Aggiungi Colonna: Aggiunge una nuova colonna alla tabella",
-                    "• Doppio clic sull'intestazione: Rinomina una colonna esistente",
-                    "• Tipi disponibili: TESTO, DATA, FILE",
-                    "• Le colonne FILE permettono di allegare più file a ciascun record"
-                ]
-            },
-            {
-                "title": "Scorciatoie da Tastiera",
-                "content": [
-                    "• Invio: Salva la modifica nella cella o nel campo",
-                    "• Shift+Invio: Vai a capo nelle caselle di testo multi-riga",
-                    "• Ctrl+Z: Annulla l'ultima operazione (max 3)",
-                    "• Ctrl+Shift+Z: Ripristina l'operazione annullata",
-                    "• Doppio clic: Apre l'editor per celle o rinomina colonne"
-                ]
-            },
-            {
-                "title": "Undo/Redo",
-                "content": [
-                    "• Il sistema tiene traccia delle ultime 3 operazioni",
-                    "• Supporta: inserimento, modifica ed eliminazione record",
-                    "• Ctrl+Z annulla l'ultima operazione",
-                    "• Ctrl+Shift+Z ripristina l'operazione annullata",
-                    "• Il feedback appare nella barra di stato"
-                ]
-            },
-            {
-                "title": "Sicurezza",
-                "content": [
-                    "• Il database è protetto con crittografia AES-128",
-                    "• Cambia Password: Modifica la password di accesso all'applicazione",
-                    "• Backup: Crea una copia di sicurezza del database"
-                ]
-            },
-            {
-                "title": "Aggiornamenti",
-                "content": [
-                    "• L'applicazione verifica automaticamente la presenza di aggiornamenti all'avvio",
-                    "• Se disponibile una nuova versione, verrà proposto il download e l'installazione",
-                    "• Gli aggiornamenti preservano tutti i dati esistenti"
-                ]
-            },
-            {
-                "title": "Ricerca",
-                "content": [
-                    "• Usa il campo di ricerca in alto a destra per filtrare i record",
-                    "• La ricerca è case-insensitive e funziona su tutti i campi"
-                ]
-            }
-        ]
-        
-        for section in tutorial_sections:
-            section_title = QLabel(section["title"])
-            section_title.setFont(QFont("Segoe UI", 11, QFont.Weight.Bold))
-            scroll_layout.addWidget(section_title)
-            
-            for line in section["content"]:
-                line_label = QLabel(line)
-                line_label.setFont(QFont("Segoe UI", 10))
-                # default colors
-                scroll_layout.addWidget(line_label)
-        
-        scroll_layout.addStretch()
-        scroll_widget.setLayout(scroll_layout)
-        scroll.setWidget(scroll_widget)
-        main_layout.addWidget(scroll)
+        self.scroll = QScrollArea()
+        self.scroll.setWidgetResizable(True)
+        main_layout.addWidget(self.scroll)
         
         close_btn = QPushButton("Chiudi")
         close_btn.clicked.connect(self.accept)
         main_layout.addWidget(close_btn)
         
         self.setLayout(main_layout)
+    
+    def showEvent(self, event):
+        if not self._populated:
+            self._populated = True
+            self._populate_sections()
+        super().showEvent(event)
+    
+    def _populate_sections(self):
+        scroll_widget = QWidget()
+        scroll_layout = QVBoxLayout()
+        
+        # Un'unica etichetta rich text al posto di una QLabel per riga:
+        # un solo widget da creare e un solo passaggio di layout
+        content = QLabel(_tutorial_html())
+        content.setTextFormat(Qt.TextFormat.RichText)
+        content.setWordWrap(True)
+        content.setFont(_font(10))
+        content.setAlignment(Qt.AlignmentFlag.AlignTop | Qt.AlignmentFlag.AlignLeft)
+        scroll_layout.addWidget(content)
+        
+        scroll_layout.addStretch()
+        scroll_widget.setLayout(scroll_layout)
+        self.scroll.setWidget(scroll_widget)
+
+
+_screen_geometry = None
+_watched_screen = None
+
+
+def _reset_screen_geometry(*_):
+    global _screen_geometry
+    _screen_geometry = None
+
+
+def _primary_screen_geometry():
+    """Geometria dello schermo principale, memorizzata finché risoluzione o schermo non cambiano."""
+    global _screen_geometry, _watched_screen
+    if _screen_geometry is None:
+        screen = QApplication.primaryScreen()
+        if screen is not _watched_screen:
+            if _watched_screen is None:
+                QApplication.instance().primaryScreenChanged.connect(_reset_screen_geometry)
+            screen.geometryChanged.connect(_reset_screen_geometry)
+            _watched_screen = screen
+        _screen_geometry = screen.geometry()
+    return _screen_geometry
 
 
 def center_dialog(dialog, width_percent=0.5, height_percent=0.75):
-    screen = QApplication.primaryScreen()
-    screen_geometry = screen.geometry()
-    width = int(screen_geometry.width() * width_percent)
-    height = int(screen_geometry.height() * height_percent)
+    screen_geometry = _primary_screen_geometry()
+    screen_width = screen_geometry.width()
+    screen_height = screen_geometry.height()
+    width = int(screen_width * width_percent)
+    height = int(screen_height * height_percent)
     
     dialog.setGeometry(0, 0, width, height)
     
-    x = (screen_geometry.width() - width) // 2
-    y = (screen_geometry.height() - height) // 2
+    x = (screen_width - width) // 2
+    y = (screen_height - height) // 2
     dialog.move(x, y)
 
 
@@ -206,6 +313,7 @@ class NewTableDialog(QDialog):
         self.db_manager = db_manager
         self.style_manager = style_manager
         self.columns = []
+        self._name_set = set()  # nomi (minuscoli) già presenti in self.columns
         
         self.setWindowTitle("Crea Nuova Tabella")
         center_dialog(self, 0.45, 0.8)
@@ -215,12 +323,12 @@ class NewTableDialog(QDialog):
         layout = QVBoxLayout()
         
         title = QLabel("Crea Nuova Tabella")
-        title_font = QFont("Segoe UI", 13, QFont.Weight.Bold)
+        title_font = _font(13, True)
         title.setFont(title_font)
         layout.addWidget(title)
         
         name_label = QLabel("Nome Tabella:")
-        name_label.setFont(QFont("Segoe UI", 9, QFont.Weight.Bold))
+        name_label.setFont(_font(9, True))
         layout.addWidget(name_label)
         
         self.name_input = QLineEdit()
@@ -228,7 +336,7 @@ class NewTableDialog(QDialog):
         layout.addWidget(self.name_input)
         
         columns_label = QLabel("Colonne:")
-        columns_label.setFont(QFont("Segoe UI", 9, QFont.Weight.Bold))
+        columns_label.setFont(_font(9, True))
         layout.addWidget(columns_label)
         
         self.columns_list = QListWidget()
@@ -238,7 +346,7 @@ class NewTableDialog(QDialog):
         add_col_layout = QVBoxLayout()
         
         add_col_title = QLabel("Aggiungi Colonna")
-        add_col_title.setFont(QFont("Segoe UI", 9, QFont.Weight.Bold))
+        add_col_title.setFont(_font(9, True))
         add_col_layout.addWidget(add_col_title)
         
         input_layout = QHBoxLayout()
@@ -280,6 +388,7 @@ class NewTableDialog(QDialog):
         
         self.setLayout(layout)
     
+    @pyqtSlot()
     def add_column(self):
         col_name = self.col_name_input.text().strip()
         col_type = self.col_type_combo.currentText()
@@ -288,8 +397,7 @@ class NewTableDialog(QDialog):
             return
         
         # Controllo duplicati: verifica se esiste già una colonna con lo stesso nome
-        existing_names = [col['name'].lower() for col in self.columns]
-        if col_name.lower() in existing_names:
+        if col_name.lower() in self._name_set:
             QMessageBox.warning(self, "Errore", f"Esiste già una colonna con il nome '{col_name}'.")
             return
         
@@ -308,18 +416,23 @@ class NewTableDialog(QDialog):
             'special': special if special else None,
             'extra': ''
         })
+        self._name_set.add(col_name.lower())
         
         self.col_name_input.clear()
         self.update_columns_list()
     
     def update_columns_list(self):
+        items = [
+            f"{col['name']} ({col['sql_type']})" + (f" [{col['special']}]" if col['special'] else "")
+            for col in self.columns
+        ]
+        # Un solo aggiornamento del modello invece di uno per elemento
+        self.columns_list.setUpdatesEnabled(False)
         self.columns_list.clear()
-        for col in self.columns:
-            info = f"{col['name']} ({col['sql_type']})"
-            if col['special']:
-                info += f" [{col['special']}]"
-            self.columns_list.addItem(info)
+        self.columns_list.addItems(items)
+        self.columns_list.setUpdatesEnabled(True)
     
+    @pyqtSlot()
     def create_table(self):
         table_name = self.name_input.text().strip()
         
@@ -345,6 +458,31 @@ class RecordDialog(QDialog):
         self.record_id = record_data[0] if record_data else None
         self.widgets = {}
         
+        # Cifrature degli allegati in corso (il salvataggio resta disabilitato finché non terminano)
+        self._pending_encryptions = 0
+        self._encrypt_workers = set()
+        
+        # Stato delle colonne FILE, indicizzato per nome colonna
+        self._files = {}           # col_name -> [(original_name, encrypted_filename), ...]
+        self._file_lists = {}      # col_name -> QListWidget
+        self._file_add_btns = {}   # col_name -> pulsante "Aggiungi File"
+        
+        # Colonne e tipi speciali letti una sola volta per tutto il dialog
+        self._columns = db_manager.get_columns(table_name)
+        self._specials = db_manager.get_special_types_map(table_name)
+        
+        # Errore corrente per ogni campo ("" = valido) e numero di campi non validi:
+        # ad ogni modifica si rivalida solo il campo che è cambiato
+        self._field_errors = {}
+        self._invalid_count = 0
+        
+        # I campi modificati vengono rivalidati a raffica di tasti finita (80 ms)
+        self._dirty_fields = set()
+        self._validate_timer = QTimer(self)
+        self._validate_timer.setSingleShot(True)
+        self._validate_timer.setInterval(80)
+        self._validate_timer.timeout.connect(self._do_validate)
+        
         self.setWindowTitle("Aggiungi Nuovo Record" if not record_data else "Modifica Record")
         center_dialog(self, 0.4, 0.75)
         self.init_ui()
@@ -354,7 +492,7 @@ class RecordDialog(QDialog):
         
         title_text = "Aggiungi Nuovo Record" if not self.record_data else "Modifica Record"
         title = QLabel(title_text)
-        title_font = QFont("Segoe UI", 12, QFont.Weight.Bold)
+        title_font = _font(12, True)
         title.setFont(title_font)
         layout.addWidget(title)
         
@@ -366,9 +504,10 @@ class RecordDialog(QDialog):
         scroll_widget = QWidget()
         form_layout = QVBoxLayout()
         
-        columns = self.db_manager.get_columns(self.table_name)
+        # Nessun ridisegno intermedio mentre si costruiscono i campi: un solo paint alla fine
+        scroll_widget.setUpdatesEnabled(False)
         
-        for col_idx, col in enumerate(columns):
+        for col_idx, col in enumerate(self._columns):
             col_name = col[1]
             is_pk = col[5]
             
@@ -378,119 +517,58 @@ class RecordDialog(QDialog):
             value = self.record_data[col_idx] if self.record_data else None
             
             label = QLabel(col_name)
-            label.setFont(QFont("Segoe UI", 9, QFont.Weight.Bold))
+            label.setFont(_font(9, True))
             form_layout.addWidget(label)
             
-            spec_info = self.db_manager.get_special_type(self.table_name, col_name)
+            spec_info = self._specials.get(col_name)
             spec_type = spec_info[0] if spec_info else None
             
             if spec_type == "FILE":
                 # Multi-file picker: encrypt and copy selected files into app's files/ folder
-                file_frame = QFrame()
-                file_main_layout = QVBoxLayout()
-                file_main_layout.setContentsMargins(0, 0, 0, 0)
-
-                # List widget to show selected files
                 file_list = QListWidget()
                 file_list.setMaximumHeight(100)
-                file_main_layout.addWidget(file_list)
-
-                # Data structure to hold list of files: [(original_name, encrypted_filename), ...]
-                existing_files = parse_multi_file_value(str(value)) if value else []
-                file_data = {"files": existing_files.copy()}
-
-                def update_file_list(lst, data):
-                    lst.clear()
-                    for orig, _ in data["files"]:
-                        lst.addItem(orig)
-
-                update_file_list(file_list, file_data)
-
-                def make_add_file(lst, data):
-                    def add_file():
-                        src_paths, _ = QFileDialog.getOpenFileNames(self, "Seleziona File", "", "Tutti i file (*.*)")
-                        for src_path in src_paths:
-                            if src_path:
-                                try:
-                                    files_dir = get_files_dir()
-                                    original_name = os.path.basename(src_path)
-                                    # Create encrypted filename with .enc extension
-                                    encrypted_name = f"{uuid.uuid4().hex}.enc"
-                                    dest_path = os.path.join(files_dir, encrypted_name)
-                                    # Encrypt and save the file
-                                    if encrypt_file(src_path, dest_path):
-                                        data["files"].append((original_name, encrypted_name))
-                                except Exception:
-                                    pass
-                        update_file_list(lst, data)
-                        self.validate_form()
-                    return add_file
-
-                def make_remove_selected(lst, data):
-                    def remove_selected():
-                        current_row = lst.currentRow()
-                        if current_row >= 0 and current_row < len(data["files"]):
-                            # Delete the physical file
-                            _, encrypted_filename = data["files"][current_row]
-                            if encrypted_filename:
-                                delete_encrypted_file(encrypted_filename)
-                            data["files"].pop(current_row)
-                            update_file_list(lst, data)
-                        self.validate_form()
-                    return remove_selected
-
-                def make_remove_all(lst, data):
-                    def remove_all():
-                        for _, encrypted_filename in data["files"]:
-                            if encrypted_filename:
-                                delete_encrypted_file(encrypted_filename)
-                        data["files"] = []
-                        update_file_list(lst, data)
-                        self.validate_form()
-                    return remove_all
+                form_layout.addWidget(file_list)
+
+                # Lista dei file della colonna: [(original_name, encrypted_filename), ...]
+                self._files[col_name] = parse_multi_file_value(str(value)) if value else []
+                self._file_lists[col_name] = file_list
+                self._refresh_file_list(col_name)
 
                 btn_layout = QHBoxLayout()
                 add_btn = QPushButton("Aggiungi File")
-                add_btn.clicked.connect(make_add_file(file_list, file_data))
+                add_btn.clicked.connect(lambda _=False, n=col_name: self._add_files(n))
                 btn_layout.addWidget(add_btn)
+                self._file_add_btns[col_name] = add_btn
 
                 remove_btn = QPushButton("Rimuovi Selezionato")
-                remove_btn.clicked.connect(make_remove_selected(file_list, file_data))
+                remove_btn.clicked.connect(lambda _=False, n=col_name: self._remove_selected_file(n))
                 btn_layout.addWidget(remove_btn)
 
                 remove_all_btn = QPushButton("Rimuovi Tutti")
-                remove_all_btn.clicked.connect(make_remove_all(file_list, file_data))
+                remove_all_btn.clicked.connect(lambda _=False, n=col_name: self._remove_all_files(n))
                 btn_layout.addWidget(remove_all_btn)
 
-                file_main_layout.addLayout(btn_layout)
-                file_frame.setLayout(file_main_layout)
-                form_layout.addWidget(file_frame)
+                form_layout.addLayout(btn_layout)
 
-                self.widgets[col_name] = {"type": "FILE", "data": file_data}
+                self.widgets[col_name] = {"type": "FILE"}
                 
             elif spec_type == "RELATION":
                 # Legacy RELATION support - treat as text field
-                text_input = MultiLineTextEdit()
+                text_input = MultiLineTextEdit(save_callback=self.save_if_valid)
                 if value is not None:
                     text_input.setPlainText(InputValidator.desanitize_text(str(value)))
-                text_input.textChanged.connect(self.validate_form)
+                text_input.textChanged.connect(partial(self._validate_field, col_name))
                 form_layout.addWidget(text_input)
-                self.widgets[col_name] = {"type": "TEXT", "widget": text_input}
+                self.widgets[col_name] = {"type": "TEXT", "widget": text_input,
+                                          "get_value": text_input.toPlainText}
                 
             elif spec_type == "DATE":
-                date_frame = QFrame()
-                date_layout = QVBoxLayout()
-                date_layout.setContentsMargins(0, 0, 0, 0)
-                
                 date_edit = QDateEdit()
                 date_edit.setCalendarPopup(True)
                 date_edit.setDate(QDate.fromString(str(value), "yyyy-MM-dd") if value else QDate.currentDate())
                 date_edit.setDisplayFormat("yyyy-MM-dd")
-                date_edit.dateChanged.connect(self.validate_form)
-                date_layout.addWidget(date_edit)
-                
-                date_frame.setLayout(date_layout)
-                form_layout.addWidget(date_frame)
+                date_edit.dateChanged.connect(partial(self._validate_field, col_name))
+                form_layout.addWidget(date_edit)
                 
                 self.widgets[col_name] = {"type": "DATE", "widget": date_edit}
                 
@@ -498,23 +576,33 @@ class RecordDialog(QDialog):
                 col_type_from_pragma = col[2]
                 
                 if col_type_from_pragma == "REAL":
-                    # For legacy REAL columns, use text edit (NUMERO type removed)
-                    text_input = MultiLineTextEdit()
+                    # For legacy REAL columns (NUMERO type removed) a single-line field
+                    # restricted to numbers is enough: much lighter than a multi-line editor
+                    number_input = QLineEdit()
                     if value is not None:
-                        text_input.setPlainText(InputValidator.desanitize_text(str(value)))
-                    text_input.textChanged.connect(self.validate_form)
-                    form_layout.addWidget(text_input)
-                    self.widgets[col_name] = {"type": "TEXT", "widget": text_input}
+                        number_input.setText(str(value))
+                    # Il validatore agisce solo sull'input dell'utente: segno ed esponente
+                    # ammessi, così valori come -2.0 o 1e-05 restano invariati
+                    number_validator = QDoubleValidator(number_input)
+                    number_validator.setNotation(QDoubleValidator.Notation.ScientificNotation)
+                    number_validator.setLocale(QLocale.c())
+                    number_input.setValidator(number_validator)
+                    number_input.textChanged.connect(partial(self._validate_field, col_name))
+                    form_layout.addWidget(number_input)
+                    self.widgets[col_name] = {"type": "TEXT", "widget": number_input,
+                                              "get_value": number_input.text}
                 else:
                     # Use multiline text edit that allows any character
-                    text_input = MultiLineTextEdit()
+                    text_input = MultiLineTextEdit(save_callback=self.save_if_valid)
                     if value is not None:
                         text_input.setPlainText(InputValidator.desanitize_text(str(value)))
-                    text_input.textChanged.connect(self.validate_form)
+                    text_input.textChanged.connect(partial(self._validate_field, col_name))
                     form_layout.addWidget(text_input)
-                    self.widgets[col_name] = {"type": "TEXT", "widget": text_input}
+                    self.widgets[col_name] = {"type": "TEXT", "widget": text_input,
+                                              "get_value": text_input.toPlainText}
         
         form_layout.addStretch()
+        scroll_widget.setUpdatesEnabled(True)
         scroll_widget.setLayout(form_layout)
         scroll.setWidget(scroll_widget)
         layout.addWidget(scroll)
@@ -536,83 +624,131 @@ class RecordDialog(QDialog):
         
         self.setLayout(layout)
         
+        # Stato iniziale: tutti i campi vengono validati una volta
         self.validate_form()
     
+    def _refresh_file_list(self, col_name):
+        lst = self._file_lists[col_name]
+        # Svuotamento e riempimento in un solo passaggio, senza ridisegni intermedi
+        lst.setUpdatesEnabled(False)
+        lst.clear()
+        lst.addItems([orig for orig, _ in self._files[col_name]])
+        lst.setUpdatesEnabled(True)
+    
+    def _add_files(self, col_name):
+        src_paths, _ = QFileDialog.getOpenFileNames(self, "Seleziona File", "", "Tutti i file (*.*)")
+        if not src_paths:
+            return
+        
+        # La cifratura gira sul thread pool: la finestra resta reattiva
+        worker = EncryptFilesWorker(src_paths)
+        worker.signals.finished.connect(
+            lambda added, w=worker, n=col_name: self._on_files_encrypted(n, w, added))
+        self._encrypt_workers.add(worker)
+        self._pending_encryptions += 1
+        self._file_add_btns[col_name].setEnabled(False)
+        self._update_validation_state()
+        QThreadPool.globalInstance().start(worker)
+    
+    def _on_files_encrypted(self, col_name, worker, added):
+        self._encrypt_workers.discard(worker)
+        self._pending_encryptions -= 1
+        if not self.isVisible():
+            # Dialog già chiuso: gli allegati non verranno mai salvati
+            for _, encrypted_name in added:
+                delete_encrypted_file(encrypted_name)
+            return
+        self._files[col_name].extend(added)
+        self._refresh_file_list(col_name)
+        self._file_add_btns[col_name].setEnabled(True)
+        self._update_validation_state()
+    
+    def _remove_selected_file(self, col_name):
+        files = self._files[col_name]
+        current_row = self._file_lists[col_name].currentRow()
+        if 0 <= current_row < len(files):
+            # Delete the physical file
+            _, encrypted_filename = files.pop(current_row)
+            if encrypted_filename:
+                delete_encrypted_file(encrypted_filename)
+            self._refresh_file_list(col_name)
+    
+    def _remove_all_files(self, col_name):
+        for _, encrypted_filename in self._files[col_name]:
+            if encrypted_filename:
+                delete_encrypted_file(encrypted_filename)
+        self._files[col_name] = []
+        self._refresh_file_list(col_name)
+    
+    def save_if_valid(self) -> bool:
+        """Salva se il form è valido (Invio da tastiera). Restituisce False se il salvataggio non è permesso."""
+        # Lo stato del pulsante potrebbe attendere una validazione rimandata
+        self.flush_validation()
+        if self.save_btn_ref and self.save_btn_ref.isEnabled():
+            self.save_record()
+            return True
+        return False
+    
+    @pyqtSlot()
     def save_record(self):
         data = {}
         errors = []
+        # Riferimenti locali: evitano la ricerca dell'attributo sulla classe ad ogni campo
+        validate_text = InputValidator.validate_text
+        validate_date = InputValidator.validate_date
+        sanitize_text = InputValidator.sanitize_text
         
         for col_name, widget_info in self.widgets.items():
             widget_type = widget_info["type"]
             
             if widget_type == "FILE":
                 # Multi-file support: format list of files into DB string
-                files_list = widget_info["data"].get("files", [])
+                files_list = self._files[col_name]
                 data[col_name] = format_multi_file_value(files_list) if files_list else None
             elif widget_type == "DATE":
                 date_edit = widget_info["widget"]
                 date_value = date_edit.date().toString("yyyy-MM-dd")
-                is_valid, error_msg = InputValidator.validate_date(date_value)
+                is_valid, error_msg = validate_date(date_value)
                 if not is_valid:
                     errors.append(f"{col_name}: {error_msg}")
                 else:
                     data[col_name] = date_value
-            elif isinstance(widget_info["widget"], QComboBox):
-                value = widget_info["widget"].currentText()
-                is_valid, error_msg = InputValidator.validate_text(value)
-                if not is_valid:
-                    errors.append(f"{col_name}: {error_msg}")
-                else:
-                    # Sanitize the combobox text input
-                    data[col_name] = InputValidator.sanitize_text(value)
             else:
-                # Handle both QLineEdit and QPlainTextEdit (MultiLineTextEdit)
-                text_widget = widget_info["widget"]
-                if hasattr(text_widget, 'toPlainText'):
-                    value = text_widget.toPlainText()
-                else:
-                    value = text_widget.text()
-                is_valid, error_msg = InputValidator.validate_text(value)
+                # Getter scelto alla creazione del campo (QLineEdit o MultiLineTextEdit)
+                value = widget_info["get_value"]()
+                is_valid, error_msg = validate_text(value)
                 if not is_valid:
                     errors.append(f"{col_name}: {error_msg}")
                 else:
                     # Sanitize the text input to handle special characters
-                    data[col_name] = InputValidator.sanitize_text(value)
+                    data[col_name] = sanitize_text(value)
         
         if errors:
             QMessageBox.warning(self, "Errore di Validazione", "\n".join(errors))
             return
         
         if self.record_id:
-            # Before updating, handle file cleanup: if a FILE column had an old filename and
-            # it's been replaced or removed, delete the old file copy from app/files
+            # Allegati presenti nel record salvato ma non più nel nuovo valore: vanno
+            # eliminati dalla cartella files, ma solo dopo che l'aggiornamento è riuscito
+            stale_files = []
+            file_cols = list(self._files)
             try:
-                old_record = self.db_manager.get_records(self.table_name, "id=?", (self.record_id,))
-                if old_record:
-                    cols = self.db_manager.get_columns(self.table_name)
-                    # old_record[0] aligns with cols
-                    for idx, col in enumerate(cols):
-                        col_name = col[1]
-                        spec = self.db_manager.get_special_type(self.table_name, col_name)
-                        if spec and spec[0] == 'FILE':
-                            old_val = old_record[0][idx]
-                            new_val = data.get(col_name)
-                            if old_val and (not new_val or new_val != old_val):
-                                try:
-                                    try:
-                                        files_dir = get_files_dir()
-                                        path_to_remove = os.path.join(files_dir, str(old_val))
-                                    except Exception:
-                                        files_dir = os.path.join(getattr(self.parent(), 'app_path', os.path.dirname(os.path.abspath(__file__))), 'files')
-                                        path_to_remove = os.path.join(files_dir, str(old_val))
-                                    if os.path.exists(path_to_remove):
-                                        os.remove(path_to_remove)
-                                except Exception:
-                                    pass
+                # Solo le colonne FILE del record salvato, non l'intera riga
+                old_values = self.db_manager.get_values(self.table_name, file_cols, self.record_id) if file_cols else None
+                if old_values:
+                    for col_name, old_val in zip(file_cols, old_values):
+                        if not old_val:
+                            continue
+                        kept = {enc for _, enc in self._files[col_name]}
+                        stale_files.extend(enc for _, enc in parse_multi_file_value(str(old_val))
+                                           if enc not in kept)
             except Exception:
-                pass
+                stale_files = []
 
             if self.db_manager.update_record(self.table_name, self.record_id, data):
+                if stale_files:
+                    # La cancellazione (anche lenta, es. su disco di rete) non blocca la GUI
+                    QThreadPool.globalInstance().start(DeleteFilesWorker(stale_files))
                 QMessageBox.information(self, "Successo", "Record aggiornato!")
                 self.accept()
             else:
@@ -624,51 +760,75 @@ class RecordDialog(QDialog):
             else:
                 QMessageBox.warning(self, "Errore", "Errore nell'aggiunta del record.")
     
+    @pyqtSlot()
     def validate_form(self):
-        errors = []
-        
-        for col_name, widget_info in self.widgets.items():
-            widget_type = widget_info["type"]
-            
-            if widget_type == "FILE":
-                # FILE columns are optional - no validation error if empty
-                pass
-            elif widget_type == "DATE":
-                date_edit = widget_info["widget"]
-                date_value = date_edit.date().toString("yyyy-MM-dd")
-                is_valid, error_msg = InputValidator.validate_date(date_value)
-                if not is_valid:
-                    errors.append(f"{col_name}: {error_msg}")
-            elif isinstance(widget_info["widget"], QComboBox):
-                value = widget_info["widget"].currentText()
-                if not value:
-                    errors.append(f"{col_name}: Selezionare un valore")
-            else:
-                # Handle both QLineEdit and QPlainTextEdit (MultiLineTextEdit)
-                text_widget = widget_info["widget"]
-                if hasattr(text_widget, 'toPlainText'):
-                    value = text_widget.toPlainText()
-                else:
-                    value = text_widget.text()
-                is_valid, error_msg = InputValidator.validate_text(value)
-                if not is_valid:
-                    errors.append(f"{col_name}: {error_msg}")
-        
-        if errors:
+        """Valida tutti i campi del form (usata alla costruzione del dialog)."""
+        self._dirty_fields.clear()
+        self._field_errors = {}
+        self._invalid_count = 0
+        for col_name in self.widgets:
+            error = self._field_error(col_name)
+            self._field_errors[col_name] = error
+            if error:
+                self._invalid_count += 1
+        self._update_validation_state()
+    
+    def _validate_field(self, col_name, *_):
+        """Segna il campo come modificato; la validazione è rimandata e raggruppata (vedi _do_validate)."""
+        self._dirty_fields.add(col_name)
+        self._validate_timer.start()
+    
+    def flush_validation(self):
+        """Esegue subito un'eventuale validazione in attesa."""
+        if self._validate_timer.isActive():
+            self._validate_timer.stop()
+            self._do_validate()
+    
+    @pyqtSlot()
+    def _do_validate(self):
+        """Rivalida i campi modificati e aggiorna il conteggio dei campi non validi."""
+        for col_name in self._dirty_fields:
+            was_invalid = bool(self._field_errors.get(col_name))
+            error = self._field_error(col_name)
+            self._field_errors[col_name] = error
+            self._invalid_count += bool(error) - was_invalid
+        self._dirty_fields.clear()
+        self._update_validation_state()
+    
+    def _field_error(self, col_name) -> str:
+        widget_info = self.widgets[col_name]
+        widget_type = widget_info["type"]
+        
+        if widget_type == "FILE":
+            # FILE columns are optional - no validation error if empty
+            return ""
+        if widget_type == "DATE":
+            date_value = widget_info["widget"].date().toString("yyyy-MM-dd")
+            is_valid, error_msg = InputValidator.validate_date(date_value)
+        else:
+            # Getter scelto alla creazione del campo (QLineEdit o MultiLineTextEdit)
+            value = widget_info["get_value"]()
+            is_valid, error_msg = InputValidator.validate_text(value)
+        return "" if is_valid else f"{col_name}: {error_msg}"
+    
+    def _update_validation_state(self):
+        if self._invalid_count:
+            errors = [error for error in self._field_errors.values() if error]
             self.validation_label.setText("Attenzione: " + " | ".join(errors))
             if self.save_btn_ref:
                 self.save_btn_ref.setEnabled(False)
+        elif self._pending_encryptions:
+            self.validation_label.setText("Cifratura dei file in corso...")
+            if self.save_btn_ref:
+                self.save_btn_ref.setEnabled(False)
         else:
             self.validation_label.setText("Tutti i campi sono validi")
             if self.save_btn_ref:
                 self.save_btn_ref.setEnabled(True)
     
     def keyPressEvent(self, event):
-        from PyQt6.QtCore import Qt
-        if event.key() == Qt.Key.Key_Return or event.key() == Qt.Key.Key_Enter:
-            if self.save_btn_ref and self.save_btn_ref.isEnabled():
-                self.save_record()
-            else:
+        if event.key() in _ENTER_KEYS:
+            if not self.save_if_valid():
                 event.ignore()
         else:
             super().keyPressEvent(event)
@@ -680,6 +840,8 @@ class AddColumnDialog(QDialog):
         self.db_manager = db_manager
         self.style_manager = style_manager
         self.table_name = table_name
+        # Nomi (minuscoli) delle colonne esistenti, per il controllo dei duplicati
+        self._existing_names = {col[1].lower() for col in db_manager.get_columns(table_name)}
         
         self.setWindowTitle("Aggiungi Colonna")
         center_dialog(self, 0.35, 0.5)
@@ -689,7 +851,7 @@ class AddColumnDialog(QDialog):
         layout = QVBoxLayout()
         
         title = QLabel("Aggiungi Nuova Colonna")
-        title.setFont(QFont("Segoe UI", 11, QFont.Weight.Bold))
+        title.setFont(_font(11, True))
         layout.addWidget(title)
         
         layout.addWidget(QLabel("Nome Colonna:"))
@@ -699,19 +861,9 @@ class AddColumnDialog(QDialog):
         
         layout.addWidget(QLabel("Tipo:"))
         self.type_combo = QComboBox()
-        self.type_combo.addItems(["TESTO", "DATA", "FILE"])
-        self.type_combo.currentTextChanged.connect(self.on_type_changed)
+        self.type_combo.addItems(list(_COLUMN_TYPES))
         layout.addWidget(self.type_combo)
         
-        self.relation_frame = QFrame()
-        relation_layout = QVBoxLayout()
-        relation_layout.addWidget(QLabel("Tabella Correlata:"))
-        self.relation_combo = QComboBox()
-        relation_layout.addWidget(self.relation_combo)
-        self.relation_frame.setLayout(relation_layout)
-        self.relation_frame.hide()
-        layout.addWidget(self.relation_frame)
-        
         layout.addStretch()
         
         button_layout = QHBoxLayout()
@@ -728,15 +880,7 @@ class AddColumnDialog(QDialog):
         
         self.setLayout(layout)
     
-    def on_type_changed(self):
-        if self.type_combo.currentText() == "RELAZIONE":
-            tables = [t for t in self.db_manager.get_tables() if t != self.table_name]
-            self.relation_combo.clear()
-            self.relation_combo.addItems(tables)
-            self.relation_frame.show()
-        else:
-            self.relation_frame.hide()
-    
+    @pyqtSlot()
     def add_column(self):
         col_name = self.name_input.text().strip()
         col_type = self.type_combo.currentText()
@@ -746,37 +890,36 @@ class AddColumnDialog(QDialog):
             return
         
         # Controllo duplicati: verifica se esiste già una colonna con lo stesso nome
-        existing_columns = self.db_manager.get_columns(self.table_name)
-        existing_names = [col[1].lower() for col in existing_columns]
-        if col_name.lower() in existing_names:
+        if col_name.lower() in self._existing_names:
             QMessageBox.warning(self, "Errore", f"Esiste già una colonna con il nome '{col_name}'.")
             return
         
-        sql_type = "TEXT"
-        special_type = ""
-        extra_info = ""
-        
-        if col_type == "FILE":
-            sql_type = "TEXT"
-            special_type = "FILE"
-        elif col_type == "DATA":
-            special_type = "DATE"
+        sql_type, special_type = _COLUMN_TYPES.get(col_type, ("TEXT", ""))
         
-        if self.db_manager.add_column(self.table_name, col_name, sql_type, special_type, extra_info):
+        if self.db_manager.add_column(self.table_name, col_name, sql_type, special_type):
+            self._existing_names.add(col_name.lower())
             QMessageBox.information(self, "Successo", f"Colonna '{col_name}' aggiunta!")
             self.accept()
         else:
             QMessageBox.warning(self, "Errore", "Errore nell'aggiunta della colonna.")
     
     def keyPressEvent(self, event):
-        from PyQt6.QtCore import Qt
-        if event.key() == Qt.Key.Key_Return or event.key() == Qt.Key.Key_Enter:
+        if event.key() in _ENTER_KEYS:
             self.add_column()
         else:
             super().keyPressEvent(event)
 
 
 
+def _add_password_row(layout, label_text: str) -> QLineEdit:
+    """Aggiunge a `layout` un'etichetta seguita da un campo password e restituisce il campo."""
+    layout.addWidget(QLabel(label_text))
+    line_edit = QLineEdit()
+    line_edit.setEchoMode(QLineEdit.EchoMode.Password)
+    layout.addWidget(line_edit)
+    return line_edit
+
+
 class PasswordDialog(QDialog):
     """Dialog shown at startup asking for the application password."""
     def __init__(self, parent, auth_path: str):
@@ -822,7 +965,8 @@ class PasswordDialog(QDialog):
         if self.closing:
             return
         self.closing = True
-        print("[Auth] Accept called, starting fade-out")
+        if _DEBUG_AUTH:
+            _auth_log("[Auth] Accept called, starting fade-out")
         self.fade_out_and_close(lambda: self.done(1))  # 1 = Accepted
         
     def reject(self):
@@ -830,43 +974,48 @@ class PasswordDialog(QDialog):
         if self.closing:
             return
         self.closing = True
-        print("[Auth] Reject called, starting fade-out")
+        if _DEBUG_AUTH:
+            _auth_log("[Auth] Reject called, starting fade-out")
         self.fade_out_and_close(lambda: self.done(0))  # 0 = Rejected
         
     def fade_out_and_close(self, callback):
+        self._fade_callback = callback
+        self._fade_done = False
+        
         self.fade_out_anim = QPropertyAnimation(self, b"windowOpacity")
         self.fade_out_anim.setDuration(300)
         self.fade_out_anim.setStartValue(self.windowOpacity())
         self.fade_out_anim.setEndValue(0.0)
         self.fade_out_anim.setEasingCurve(QEasingCurve.Type.InCubic)
-        self.fade_out_anim.finished.connect(callback)
+        self.fade_out_anim.finished.connect(self._finish_fade)
         self.fade_out_anim.start()
         
-        # Failsafe: se l'animazione si blocca, chiudi comunque dopo un timeout
-        # Usiamo un timer non-singleShot che viene cancellato se finisce prima?
-        # Semplice singleShot di sicurezza:
-        QTimer.singleShot(500, callback) # 500ms > 300ms duration
+        # Failsafe: se l'animazione si blocca, chiudi comunque dopo un timeout.
+        # Il timer viene fermato da _finish_fade, così done() è chiamato una sola volta.
+        self._fade_timer = QTimer(self)
+        self._fade_timer.setSingleShot(True)
+        self._fade_timer.timeout.connect(self._finish_fade)
+        self._fade_timer.start(500)  # 500ms > 300ms duration
         
-        # Importante: se siamo in exec(), dobbiamo processare gli eventi
-        # per permettere all'animazione di girare
-        # Ma self.fade_out_anim.start() è asincrono? 
-        # In exec() modale, l'event loop è gestito da Qt.
-        # Dobbiamo solo assicurarci che non ritorni subito.
-        # Sovrascrivendo accept/reject non chiamiamo super() subito, 
-        # quindi la finestra rimane aperta mentre l'animazione gira.
-        # Quando 'finished' chiama callback (super().accept), allora si chiude.
+        # Sovrascrivendo accept/reject non chiamiamo super() subito,
+        # quindi la finestra rimane aperta (in exec()) mentre l'animazione gira.
+        # Quando 'finished' chiama _finish_fade (done()), allora si chiude.
+
+    @pyqtSlot()
+    def _finish_fade(self):
+        if self._fade_done:
+            return
+        self._fade_done = True
+        self._fade_timer.stop()
+        self._fade_callback()
 
     def init_ui(self):
         layout = QVBoxLayout()
-        layout.addWidget(QLabel("Inserisci la password per accedere:"))
-
-        self.pwd_input = QLineEdit()
-        self.pwd_input.setEchoMode(QLineEdit.EchoMode.Password)
+        self.pwd_input = _add_password_row(layout, "Inserisci la password per accedere:")
         self.pwd_input.returnPressed.connect(self.try_accept)
         # Give focus to the password field so the user can type immediately
         self.pwd_input.setFocus()
         self.pwd_input.setFocus()
-        layout.addWidget(self.pwd_input)
         
         # Etichetta per errori inline (inizialmente nascosta/vuota)
         self.error_label = QLabel("")
@@ -899,7 +1048,6 @@ class PasswordDialog(QDialog):
         super().keyPressEvent(event)
 
     def try_accept(self):
-        import auth as auth_mod
         pwd = self.pwd_input.text().strip()
         
         # Reset errore
@@ -909,6 +1057,10 @@ class PasswordDialog(QDialog):
             ok = auth_mod.verify_password(self.auth_path, pwd)
         except Exception:
             ok = False
+        
+        # Il campo viene svuotato in ogni caso, così il testo non resta nel widget
+        # durante la dissolvenza o il retry
+        self.pwd_input.clear()
 
         if ok:
             # Chiama self.accept() che ora include il fade-out
@@ -918,9 +1070,6 @@ class PasswordDialog(QDialog):
         # Mostra errore inline invece di popup
         # Questo evita che l'utente chiuda per sbaglio il dialog premendo Esc/Enter sul popup
         self.error_label.setText("Password errata")
-        
-        # Pulisce il campo password
-        self.pwd_input.clear()
         self.pwd_input.setFocus()
         
         # Non chiamare self.reject() o self.close() qui!
@@ -939,20 +1088,9 @@ class ChangePasswordDialog(QDialog):
     def init_ui(self):
         layout = QVBoxLayout()
 
-        layout.addWidget(QLabel("Password attuale:"))
-        self.current_input = QLineEdit()
-        self.current_input.setEchoMode(QLineEdit.EchoMode.Password)
-        layout.addWidget(self.current_input)
-
-        layout.addWidget(QLabel("Nuova password (solo lettere e numeri):"))
-        self.new_input = QLineEdit()
-        self.new_input.setEchoMode(QLineEdit.EchoMode.Password)
-        layout.addWidget(self.new_input)
-
-        layout.addWidget(QLabel("Conferma nuova password:"))
-        self.confirm_input = QLineEdit()
-        self.confirm_input.setEchoMode(QLineEdit.EchoMode.Password)
-        layout.addWidget(self.confirm_input)
+        self.current_input = _add_password_row(layout, "Password attuale:")
+        self.new_input = _add_password_row(layout, "Nuova password (solo lettere e numeri):")
+        self.confirm_input = _add_password_row(layout, "Conferma nuova password:")
 
         btn_layout = QHBoxLayout()
         cancel_btn = QPushButton("Annulla")
@@ -981,10 +1119,6 @@ class ChangePasswordDialog(QDialog):
         self.setLayout(layout)
 
     def try_change(self):
-        import re
-        import auth as auth_mod
-        from PyQt6.QtWidgets import QMessageBox
-
         current = self.current_input.text().strip()
         new = self.new_input.text().strip()
         confirm = self.confirm_input.text().strip()
@@ -996,19 +1130,18 @@ class ChangePasswordDialog(QDialog):
             current_ok = False
 
         if not current_ok:
+            self.current_input.clear()
             QMessageBox.warning(self, "Errore", "Password attuale errata")
-            try:
-                print(f"[auth-change] current verification failed for path={self.auth_path}")
-            except Exception:
-                pass
+            if _DEBUG_AUTH:
+                _auth_log(f"[auth-change] current verification failed for path={self.auth_path}")
             return
 
-        if new != confirm:
+        if not hmac.compare_digest(new.encode('utf-8'), confirm.encode('utf-8')):
             QMessageBox.warning(self, "Errore", "Le password non coincidono")
             return
 
         # Validate allowed characters: only letters (upper/lower) and digits
-        if not re.match(r'^(?=.*[A-Za-z])(?=.*\d)[A-Za-z0-9]+$', new):
+        if not _PASSWORD_RE.match(new):
             QMessageBox.warning(self, "Errore", "La nuova password deve contenere solo lettere e numeri, almeno una lettera e un numero")
             return
 
@@ -1022,18 +1155,23 @@ class ChangePasswordDialog(QDialog):
         except Exception:
             written = False
 
-        # Post-write verification
-        try:
-            verify_after = auth_mod.verify_password(self.auth_path, new)
-        except Exception:
-            verify_after = False
+        # set_password scrive in modo atomico (file temporaneo + fsync + replace): se
+        # riesce il file è valido. La rilettura, che ricalcola l'intero PBKDF2, resta
+        # solo come controllo diagnostico con _DEBUG_AUTH attivo
+        verify_after = written
+        if _DEBUG_AUTH and written:
+            try:
+                verify_after = auth_mod.verify_password(self.auth_path, new)
+            except Exception:
+                verify_after = False
 
-        try:
-            print(f"[auth-change] path={self.auth_path} written={written} verify_after={verify_after}")
-        except Exception:
-            pass
+        if _DEBUG_AUTH:
+            _auth_log(f"[auth-change] path={self.auth_path} written={written} verify_after={verify_after}")
 
         if written and verify_after:
+            # Il dialog può sopravvivere alla chiusura (ha un parent): non lasciare le password nei campi
+            for field in (self.current_input, self.new_input, self.confirm_input):
+                field.clear()
             QMessageBox.information(self, "Successo", "Password aggiornata")
             self.accept()
         else:
@@ -1045,9 +1183,7 @@ class ChangePasswordDialog(QDialog):
             else:
                 detail = "Errore sconosciuto durante l'aggiornamento della password."
 
-            try:
-                print(f"[auth-change] failure detail: written={written} verify_after={verify_after} path={self.auth_path}")
-            except Exception:
-                pass
+            if _DEBUG_AUTH:
+                _auth_log(f"[auth-change] failure detail: written={written} verify_after={verify_after} path={self.auth_path}")
 
             QMessageBox.warning(self, "Errore", f"Impossibile aggiornare la password: {detail}")
@@ -1,6 +1,8 @@
+import io
 import os
 import sys
 import tempfile
+from functools import lru_cache
 try:
     from PyQt6.QtCore import QStandardPaths
 except Exception:
@@ -8,12 +10,30 @@ except Exception:
 
 try:
     from cryptography.fernet import Fernet
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 except Exception:
     Fernet = None
+    AESGCM = None
+
+from crypto_utils import derive_aead_key, encrypt_gcm_frames, decrypt_gcm_frames
+
+# Formato a blocchi degli allegati: _FILE_GCM_MAGIC seguito dai blocchi AES-256-GCM
+# di crypto_utils. I file vengono cifrati un blocco alla volta, così la memoria usata
+# non dipende dalla dimensione del file.
+_FILE_CHUNK_SIZE = 64 * 1024
+_FILE_GCM_MAGIC = b'DBPFGCM1'
+
+# Inizio di ogni token Fernet a singolo blocco (formato legacy)
+_FERNET_TOKEN_PREFIX = b'gAAAAA'
+
+# Istanze Fernet / AES-GCM per app_name (vedi get_file_fernet e get_file_aead)
+_FERNET_CACHE = {}
+_AEAD_CACHE = {}
 
 # Legacy key support for backward compatibility with files encrypted before the security update
 # If you have old encrypted files, create a legacy_key.key file with your old key
 # Run setup_legacy_key.py to configure this if needed
+@lru_cache(maxsize=1)
 def _load_legacy_key() -> bytes:
     """Load legacy key from file if it exists."""
     try:
@@ -27,6 +47,19 @@ def _load_legacy_key() -> bytes:
     return None
 
 
+@lru_cache(maxsize=1)
+def _get_legacy_fernet():
+    """Fernet con la chiave legacy (None se non configurata), creato una sola volta."""
+    legacy_key = _load_legacy_key()
+    if legacy_key and Fernet is not None:
+        try:
+            return Fernet(legacy_key)
+        except Exception:
+            pass
+    return None
+
+
+@lru_cache(maxsize=None)
 def _get_data_dir(app_name: str = "DatabasePro") -> str:
     """Return the data directory (parent of files dir) for storing keys and config."""
     # Usa LocalAppData per evitare problemi di permessi
@@ -50,39 +83,68 @@ def _get_data_dir(app_name: str = "DatabasePro") -> str:
         return os.getcwd()
 
 
+def _read_files_key(key_path: str) -> bytes:
+    with open(key_path, 'rb') as kf:
+        key = kf.read()
+    if not key:
+        raise ValueError(f"Attachments key file is empty: {key_path} "
+                         "(restore it from a backup, or delete it if no attachments were ever saved)")
+    return key
+
+
 def _load_or_create_files_key(key_path: str) -> bytes:
     """Load or create the encryption key for file attachments.
     
     Similar to database key management: creates a unique key per installation.
+    The key is written to a temporary file and then linked into place, so other
+    instances never read a partial key and cannot overwrite an existing one.
     """
     try:
-        if os.path.exists(key_path):
-            with open(key_path, 'rb') as kf:
-                return kf.read()
-        else:
-            if Fernet is None:
-                raise RuntimeError('cryptography not installed')
-            key = Fernet.generate_key()
-            # Write with restricted permissions where possible
-            with open(key_path, 'wb') as kf:
+        # Caso comune: la chiave esiste già, una sola open
+        try:
+            return _read_files_key(key_path)
+        except FileNotFoundError:
+            pass
+        
+        if Fernet is None:
+            raise RuntimeError('cryptography not installed')
+        key = Fernet.generate_key()
+        # mkstemp crea il file con permessi 0600
+        fd, tmp_path = tempfile.mkstemp(prefix='files_key.', suffix='.tmp',
+                                        dir=os.path.dirname(os.path.abspath(key_path)))
+        try:
+            with os.fdopen(fd, 'wb') as kf:
                 kf.write(key)
+                kf.flush()
+                os.fsync(kf.fileno())
             try:
-                # chmod 600 on Unix; best-effort on Windows
-                os.chmod(key_path, 0o600)
-            except Exception:
-                pass
-            
-            # Hide the key file for additional security on Windows
+                # link non sovrascrive mai: se un'altra istanza è arrivata prima vale la sua chiave
+                os.link(tmp_path, key_path)
+            except FileExistsError:
+                return _read_files_key(key_path)
+            except OSError:
+                # File system senza hard link: rename (su Windows fallisce se la chiave esiste già)
+                if os.path.exists(key_path):
+                    return _read_files_key(key_path)
+                os.rename(tmp_path, key_path)
+        finally:
             try:
-                import ctypes
-                FILE_ATTRIBUTE_HIDDEN = 0x02
-                FILE_ATTRIBUTE_SYSTEM = 0x04
-                ctypes.windll.kernel32.SetFileAttributesW(key_path, FILE_ATTRIBUTE_HIDDEN | FILE_ATTRIBUTE_SYSTEM)
-            except Exception:
+                os.remove(tmp_path)
+            except OSError:
                 pass
-            
-            return key
-    except Exception:
+        
+        # Hide the key file for additional security on Windows
+        try:
+            import ctypes
+            FILE_ATTRIBUTE_HIDDEN = 0x02
+            FILE_ATTRIBUTE_SYSTEM = 0x04
+            ctypes.windll.kernel32.SetFileAttributesW(key_path, FILE_ATTRIBUTE_HIDDEN | FILE_ATTRIBUTE_SYSTEM)
+        except Exception:
+            pass
+        
+        return key
+    except Exception as e:
+        print(f"Error loading attachments key: {e}")
         return None
 
 
@@ -115,6 +177,11 @@ def get_file_fernet(app_name: str = "DatabasePro"):
     if Fernet is None:
         return None
     
+    # La chiave non cambia durante l'esecuzione: letta dal disco una sola volta
+    fernet = _FERNET_CACHE.get(app_name)
+    if fernet is not None:
+        return fernet
+    
     try:
         data_dir = _get_data_dir(app_name)
         key_path = os.path.join(data_dir, 'files_key.key')
@@ -123,56 +190,150 @@ def get_file_fernet(app_name: str = "DatabasePro"):
         if key is None:
             return None
         
-        return Fernet(key)
+        fernet = _FERNET_CACHE[app_name] = Fernet(key)
+        return fernet
     except Exception:
         return None
 
 
-def delete_encrypted_file(encrypted_filename: str) -> bool:
+def get_file_aead(app_name: str = "DatabasePro"):
+    """Return the AES-GCM instance used to encrypt attachments.
+    
+    The key is derived from the same files_key.key used by get_file_fernet, so
+    attachments in the older Fernet format remain readable.
+    """
+    if AESGCM is None:
+        return None
+    
+    aead = _AEAD_CACHE.get(app_name)
+    if aead is not None:
+        return aead
+    
+    try:
+        data_dir = _get_data_dir(app_name)
+        key_path = os.path.join(data_dir, 'files_key.key')
+        key = _load_or_create_files_key(key_path)
+        
+        if key is None:
+            return None
+        
+        aead = _AEAD_CACHE[app_name] = AESGCM(derive_aead_key(key, b'DatabasePro attachments AES-GCM'))
+        return aead
+    except Exception:
+        return None
+
+
+def delete_encrypted_file(encrypted_filename: str, files_dir: str = None) -> bool:
     """Delete an encrypted file from the files directory.
     
+    `files_dir` can be passed when deleting several files, to resolve the directory once.
     Returns True if deleted successfully, False otherwise.
     """
     if not encrypted_filename:
         return False
     
     try:
-        files_dir = get_files_dir()
-        file_path = os.path.join(files_dir, encrypted_filename)
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            return True
-        return False
+        if files_dir is None:
+            files_dir = get_files_dir()
+        # Nessun os.path.exists preliminare: un file mancante è semplicemente un OSError
+        os.remove(os.path.join(files_dir, encrypted_filename))
+        return True
     except Exception:
         return False
 
 
+def _encrypt_stream(aead, src, dst) -> None:
+    """Encrypt the file object `src` into `dst` using the AES-GCM chunked format."""
+    dst.write(_FILE_GCM_MAGIC)
+    encrypt_gcm_frames(aead, src, dst, _FILE_CHUNK_SIZE)
+
+
 def encrypt_file(src_path: str, dest_path: str) -> bool:
     """Encrypt a file and save to dest_path.
     
+    The file is encrypted in chunks of _FILE_CHUNK_SIZE, so peak memory does not
+    depend on the file size.
     Returns True on success, False on failure.
     """
     try:
-        fernet = get_file_fernet()
-        if fernet is None:
+        aead = get_file_aead()
+        if aead is None:
             # No encryption available, just copy
             import shutil
             shutil.copy2(src_path, dest_path)
             return True
         
-        with open(src_path, 'rb') as f:
-            data = f.read()
-        
-        encrypted = fernet.encrypt(data)
-        
-        with open(dest_path, 'wb') as f:
-            f.write(encrypted)
+        try:
+            with open(src_path, 'rb') as src, open(dest_path, 'wb') as dst:
+                _encrypt_stream(aead, src, dst)
+        except Exception:
+            # Non lasciare allegati cifrati a metà
+            if os.path.exists(dest_path):
+                os.remove(dest_path)
+            raise
         
         return True
     except Exception:
         return False
 
 
+def _decrypt_legacy_file(fernet, aead, encrypted_data: bytes, encrypted_path: str) -> bytes:
+    """Decrypt an attachment stored as a single Fernet token (or not encrypted at all).
+    
+    Files encrypted with the legacy key are re-encrypted with the current key
+    in the chunked format.
+    """
+    decrypted_data = None
+    needs_migration = False
+    
+    # Un token Fernet inizia sempre con versione 0x80 + timestamp (byte alti a zero),
+    # cioè "gAAAAA" in base64: se manca, il file non è cifrato (very old legacy file)
+    # e si evitano i due tentativi di verifica HMAC sull'intero contenuto
+    if fernet is not None and encrypted_data.startswith(_FERNET_TOKEN_PREFIX):
+        try:
+            # Try decrypting with current key
+            decrypted_data = fernet.decrypt(encrypted_data)
+        except Exception:
+            # Try with legacy key for backward compatibility
+            legacy_fernet = _get_legacy_fernet()
+            if legacy_fernet is not None:
+                try:
+                    decrypted_data = legacy_fernet.decrypt(encrypted_data)
+                    needs_migration = True  # Mark for re-encryption
+                except Exception:
+                    # File might not be encrypted at all (very old legacy file)
+                    decrypted_data = encrypted_data
+            else:
+                # No legacy key available, file might not be encrypted
+                decrypted_data = encrypted_data
+    else:
+        decrypted_data = encrypted_data
+    
+    # If file was decrypted with legacy key, re-encrypt with new key
+    if needs_migration and aead is not None:
+        # Nuovo file accanto all'originale, poi os.replace: due aperture contemporanee dello
+        # stesso allegato (un worker ciascuna) non scrivono mai sullo stesso file, e chi lo
+        # legge vede sempre la versione vecchia o quella nuova, mai una a metà
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(encrypted_path) + '.', suffix='.tmp',
+                                            dir=os.path.dirname(encrypted_path))
+            with os.fdopen(fd, 'wb') as f:
+                _encrypt_stream(aead, io.BytesIO(decrypted_data), f)
+            os.replace(tmp_path, encrypted_path)
+            tmp_path = None
+        except Exception:
+            pass  # Migration failed, but file is still readable
+        finally:
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+    
+    return decrypted_data
+
+
 def decrypt_file_to_temp(encrypted_filename: str, original_name: str) -> str:
     """Decrypt a file and return the path to a temporary file.
     
@@ -189,54 +350,37 @@ def decrypt_file_to_temp(encrypted_filename: str, original_name: str) -> str:
             return None
         
         fernet = get_file_fernet()
-        
-        with open(encrypted_path, 'rb') as f:
-            encrypted_data = f.read()
-        
-        decrypted_data = None
-        needs_migration = False
-        
-        if fernet is not None:
-            try:
-                # Try decrypting with current key
-                decrypted_data = fernet.decrypt(encrypted_data)
-            except Exception:
-                # Try with legacy key for backward compatibility
-                legacy_key = _load_legacy_key()
-                if legacy_key and Fernet is not None:
-                    try:
-                        legacy_fernet = Fernet(legacy_key)
-                        decrypted_data = legacy_fernet.decrypt(encrypted_data)
-                        needs_migration = True  # Mark for re-encryption
-                    except Exception:
-                        # File might not be encrypted at all (very old legacy file)
-                        decrypted_data = encrypted_data
-                else:
-                    # No legacy key available, file might not be encrypted
-                    decrypted_data = encrypted_data
-        else:
-            decrypted_data = encrypted_data
-        
-        # If file was decrypted with legacy key, re-encrypt with new key
-        if needs_migration and fernet is not None:
-            try:
-                with open(encrypted_path, 'wb') as f:
-                    f.write(fernet.encrypt(decrypted_data))
-            except Exception:
-                pass  # Migration failed, but file is still readable
+        aead = get_file_aead()
         
         # Create temp file with original extension
         ext = os.path.splitext(original_name)[1]
         fd, temp_path = tempfile.mkstemp(suffix=ext)
         
-        with os.fdopen(fd, 'wb') as f:
-            f.write(decrypted_data)
+        try:
+            with os.fdopen(fd, 'wb') as tf:
+                encrypted_data = None
+                with open(encrypted_path, 'rb') as ef:
+                    if aead is not None and ef.read(len(_FILE_GCM_MAGIC)) == _FILE_GCM_MAGIC:
+                        # Formato a blocchi: decifrato in streaming
+                        decrypt_gcm_frames(aead, ef, tf)
+                    else:
+                        ef.seek(0)
+                        encrypted_data = ef.read()
+                # Vecchio formato (token unico): l'eventuale migrazione riscrive il file,
+                # quindi va fatta dopo averlo chiuso
+                if encrypted_data is not None:
+                    tf.write(_decrypt_legacy_file(fernet, aead, encrypted_data, encrypted_path))
+        except Exception:
+            # Non lasciare su disco dati parzialmente decifrati
+            os.remove(temp_path)
+            raise
         
         return temp_path
     except Exception:
         return None
 
 
+@lru_cache(maxsize=256)
 def parse_file_value(db_value: str) -> tuple:
     """Parse a file value from DB into (original_name, encrypted_filename).
     
@@ -271,14 +415,23 @@ def parse_multi_file_value(db_value: str) -> list:
     if not db_value:
         return []
     
+    # Caso comune: un solo file legacy, senza separatori
+    if ';;' not in db_value and '|' not in db_value:
+        value = db_value.strip()
+        return [(value, value)] if value else []
+    
     files = []
-    # Split by ";;" for multiple files
-    parts = db_value.split(';;')
-    for part in parts:
-        if part.strip():
-            original, encrypted = parse_file_value(part.strip())
-            if original and encrypted:
-                files.append((original, encrypted))
+    # Un solo passaggio per parte: partition al posto di split + parse_file_value
+    for part in db_value.split(';;'):
+        part = part.strip()
+        if not part:
+            continue
+        original, sep, encrypted = part.partition('|')
+        if not sep:
+            # Legacy format: filename only
+            encrypted = original
+        if original and encrypted:
+            files.append((original, encrypted))
     
     return files
 
@@ -292,13 +445,13 @@ def format_multi_file_value(files: list) -> str:
     if not files:
         return ""
     
-    parts = [format_file_value(orig, enc) for orig, enc in files]
-    return ";;".join(parts)
+    return ";;".join([f"{orig}|{enc}" for orig, enc in files])
 
 
+@lru_cache(maxsize=256)
 def get_display_names_from_multi_file(db_value: str) -> str:
     """Get comma-separated display names from multi-file DB value."""
     files = parse_multi_file_value(db_value)
     if not files:
         return ""
-    return ", ".join([f[0] for f in files])
+    return ", ".join([original for original, _ in files])
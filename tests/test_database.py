@@ -0,0 +1,36 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager
+
+
+class BatchRollbackTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.tmp.name, "test.db"))
+        self.db.create_table("t", [{"name": "a", "sql_type": "TEXT"},
+                                   {"name": "b b", "sql_type": "TEXT"}])
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def test_rollback_clears_column_cache(self):
+        with self.assertRaises(RuntimeError):
+            with self.db.batch():
+                self.assertTrue(self.db.add_column("t", "c", "TEXT"))
+                # La cache viene popolata con la colonna poi annullata
+                self.assertIn("c", [col[1] for col in self.db.get_columns("t")])
+                raise RuntimeError("abort")
+
+        table_info = [row[1] for row in self.db.conn.execute('PRAGMA table_info("t")')]
+        self.assertEqual(table_info, ["id", "a", "b b"])
+        self.assertEqual([col[1] for col in self.db.get_columns("t")], table_info)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from PyQt6.QtWidgets import QApplication
+except ImportError:
+    QApplication = None
+
+
+@unittest.skipIf(QApplication is None, "PyQt6 not installed")
+class RecordDialogRealColumnTest(unittest.TestCase):
+    """I valori delle colonne REAL devono tornare invariati dopo apertura e salvataggio."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication([])
+
+    def setUp(self):
+        from database import DatabaseManager
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.tmp.name, "test.db"))
+        self.db.create_table("misure", [{"name": "valore", "sql_type": "REAL"}])
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def _round_trip(self, value):
+        from dialogs import RecordDialog
+        from config import StyleManager
+        self.assertTrue(self.db.insert_record("misure", {"valore": value}))
+        record = self.db.get_records("misure")[-1]
+        dialog = RecordDialog(None, self.db, StyleManager(), "misure", record)
+        self.assertEqual(dialog.widgets["valore"]["get_value"](), str(value))
+        # Le conferme modali bloccherebbero il test
+        with mock.patch("dialogs.QMessageBox"):
+            dialog.save_record()
+        saved = self.db.get_records("misure", "id=?", (record[0],))[0][1]
+        self.assertEqual(saved, value)
+
+    def test_negative_value_round_trips(self):
+        self._round_trip(-2.0)
+
+    def test_exponent_value_round_trips(self):
+        self._round_trip(1e-05)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,7 +4,7 @@ from PyQt6.QtWidgets import (
     QListWidget, QListWidgetItem, QTableWidget, QTableWidgetItem,
     QComboBox, QHeaderView, QMessageBox, QMenu, QPlainTextEdit
 )
-from PyQt6.QtCore import Qt, pyqtSignal
+from PyQt6.QtCore import Qt, pyqtSignal, QObject, QRunnable, QThreadPool
 from PyQt6.QtGui import QFont, QAction
 
 from ui_delegates import EditableTableDelegate
@@ -18,6 +18,23 @@ import sys
 from file_utils import get_files_dir, parse_file_value, decrypt_file_to_temp, parse_multi_file_value, get_display_names_from_multi_file
 
 
+class _DecryptSignals(QObject):
+    finished = pyqtSignal(str)  # percorso del file temporaneo, "" se la decifratura fallisce
+
+
+class DecryptFileWorker(QRunnable):
+    """Decifra un allegato in un file temporaneo, fuori dal thread della GUI."""
+    def __init__(self, encrypted_filename: str, original_name: str):
+        super().__init__()
+        self.encrypted_filename = encrypted_filename
+        self.original_name = original_name
+        self.signals = _DecryptSignals()
+    
+    def run(self):
+        temp_path = decrypt_file_to_temp(self.encrypted_filename, self.original_name)
+        self.signals.finished.emit(temp_path or "")
+
+
 class CellTextEdit(QPlainTextEdit):
     """Custom text edit for table cell editing. Enter saves, Shift+Enter adds newline."""
     save_requested = pyqtSignal()
@@ -148,6 +165,8 @@ class MainArea(QFrame):
         self.style_manager = style_manager
         self.db_manager = db_manager
         self.current_table = None
+        # Worker di decifratura in corso (riferimento tenuto fino al segnale finished)
+        self._decrypt_workers = set()
         self.setObjectName("mainAreaFrame")
         self.init_ui()
     
@@ -596,10 +615,16 @@ class MainArea(QFrame):
 
     def open_single_file(self, original_name: str, encrypted_filename: str):
         """Open a single encrypted file."""
+        # Decrypt file to temp location on the thread pool: large files don't freeze the window
+        worker = DecryptFileWorker(encrypted_filename, original_name or encrypted_filename)
+        worker.signals.finished.connect(
+            lambda temp_path, w=worker: self._on_file_decrypted(w, temp_path))
+        self._decrypt_workers.add(worker)
+        QThreadPool.globalInstance().start(worker)
+
+    def _on_file_decrypted(self, worker, temp_path: str):
+        self._decrypt_workers.discard(worker)
         try:
-            # Decrypt file to temp location
-            temp_path = decrypt_file_to_temp(encrypted_filename, original_name or encrypted_filename)
-            
             if not temp_path or not os.path.exists(temp_path):
                 QMessageBox.warning(self, "Errore", "Impossibile decriptare il file")
                 return
@@ -779,8 +804,7 @@ class MainArea(QFrame):
                 return
             
             # Verifica che il nome non sia già in uso
-            existing_cols = [col[1] for col in columns]
-            if new_name in existing_cols:
+            if any(col[1] == new_name for col in columns):
                 error_label.setText(f"Nome '{new_name}' già esistente")
                 return
             
@@ -3,7 +3,7 @@ from PyQt6.QtWidgets import QLineEdit, QStyledItemDelegate
 from PyQt6.QtCore import Qt, QDate, QRect, QSize
 from PyQt6.QtGui import QTextDocument, QPalette, QTextCursor, QTextCharFormat
 
-from validators import InputValidator
+from validators import InputValidator, TEXT_INPUT_PATTERN
 
 
 class EditableTableDelegate(QStyledItemDelegate):
@@ -28,7 +28,7 @@ class EditableTableDelegate(QStyledItemDelegate):
                 elif col_type == "REAL":
                     InputValidator.restrict_number_input(editor)
                 else:
-                    InputValidator.restrict_input(editor, r'^[a-zA-Z0-9\s\-._@]*$')
+                    InputValidator.restrict_input(editor, TEXT_INPUT_PATTERN)
         
         editor.returnPressed.connect(lambda: self.commitData.emit(editor))
         return editor
@@ -1,9 +1,23 @@
 import re
-from typing import Tuple
+from functools import lru_cache
+from typing import Tuple, Union
 from PyQt6.QtWidgets import QLineEdit
 from PyQt6.QtCore import QDate
 
 
+# Pattern compilati una sola volta all'import
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+TEXT_INPUT_PATTERN = re.compile(r'^[a-zA-Z0-9\s\-._@]*$')
+
+# Esito "valido" condiviso: i validatori sono chiamati ad ogni validazione del form
+_VALID = (True, "")
+
+
+@lru_cache(maxsize=32)
+def _compile(pattern: str) -> re.Pattern:
+    return re.compile(pattern)
+
+
 class InputValidator:
     @staticmethod
     def validate_text(value: str, min_length: int = 0, max_length: int = 5000) -> Tuple[bool, str]:
@@ -11,7 +25,7 @@ class InputValidator:
             return False, f"Minimum {min_length} characters required"
         if len(value) > max_length:
             return False, f"Maximum {max_length} characters allowed"
-        return True, ""
+        return _VALID
     
     @staticmethod
     def validate_number(value: str) -> Tuple[bool, str]:
@@ -19,7 +33,7 @@ class InputValidator:
             return False, "Number required"
         try:
             float(value)
-            return True, ""
+            return _VALID
         except ValueError:
             return False, "Invalid number format"
     
@@ -28,27 +42,31 @@ class InputValidator:
         if not value:
             return False, "Date required"
         try:
-            QDate.fromString(value, "yyyy-MM-dd")
             if not QDate.fromString(value, "yyyy-MM-dd").isValid():
                 return False, "Invalid date. Use YYYY-MM-DD format"
-            return True, ""
+            return _VALID
         except:
             return False, "Invalid date format"
     
     @staticmethod
     def validate_email(value: str) -> Tuple[bool, str]:
         if not value:
-            return True, ""
-        email_regex = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        if re.match(email_regex, value):
-            return True, ""
+            return _VALID
+        if EMAIL_PATTERN.match(value):
+            return _VALID
         return False, "Invalid email format"
     
     @staticmethod
-    def restrict_input(line_edit: QLineEdit, pattern: str):
-        """Restrict input to column names only (alphanumeric and underscore)."""
+    def restrict_input(line_edit: QLineEdit, pattern: Union[str, re.Pattern]):
+        """Restrict input to the characters accepted by `pattern` (string or pre-compiled)."""
+        if isinstance(pattern, str):
+            pattern = _compile(pattern)
+        
         def on_text_changed(text):
-            filtered = ''.join(c for c in text if re.match(pattern, c))
+            # Caso comune: tutto il testo è già valido, nessun filtro carattere per carattere
+            if pattern.fullmatch(text):
+                return
+            filtered = ''.join(c for c in text if pattern.match(c))
             if filtered != text:
                 line_edit.blockSignals(True)
                 line_edit.setText(filtered)